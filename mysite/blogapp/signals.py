@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from shopapp.cache import bump_generation_on_commit
+from .models import Article
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_delete, sender=Article)
+def bump_article_generation(sender, **kwargs):
+    bump_generation_on_commit("article")
@@ -5,9 +5,16 @@ from .models import Article
 class BlogSitemap(Sitemap):
     changefreq = "never"
     priority = 0.5
+    limit = 5000
 
     def items(self):
-        return Article.objects.filter(published_at__isnull=False).order_by("-published_at")
+        return (
+            Article.objects
+            .filter(published_at__isnull=False)
+            .only("pk", "published_at")
+            # по pk: новая статья попадает на последнюю страницу и не сдвигает остальные
+            .order_by("pk")
+        )
 
     def lastmod(self, obj: Article):
-        return obj.published_at
\ No newline at end of file
+        return obj.published_at
@@ -1,3 +1,35 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
 
-# Create your tests here.
+from .models import Article
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+})
+class LatestArticlesFeedTestCase(TestCase):
+    def setUp(self) -> None:
+        self.article = Article.objects.create(
+            title="First",
+            body="a" * 300,
+            published_at=timezone.now(),
+        )
+
+    def tearDown(self) -> None:
+        cache.clear()
+
+    def test_feed_is_cached_and_invalidated(self):
+        url = reverse("blogapp:articles-feed")
+        response = self.client.get(url)
+        self.assertContains(response, "a" * 200 + "<")
+        self.assertNotContains(response, "a" * 201)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(cached.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Article.objects.create(title="Second", published_at=timezone.now())
+        self.assertContains(self.client.get(url), "Second")
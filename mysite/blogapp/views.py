@@ -1,7 +1,8 @@
-from django.contrib.syndication.views import Feed
+from django.db.models.functions import Substr
 from django.views.generic import ListView, DetailView
 from django.urls import reverse, reverse_lazy
 
+from mysite.feeds import CachedFeed
 from .models import Article
 
 
@@ -15,15 +16,18 @@ class ArticleListView(ListView):
 class ArticleDetailView(DetailView):
     model = Article
 
-class LatestArticlesFeed(Feed):
+class LatestArticlesFeed(CachedFeed):
     title = "Blog articles (latest)"
     description = "Updates on changes and addition blog articles"
     link = reverse_lazy("blogapp:articles")
+    generations = ("article",)
 
     def items(self):
         return (
             Article.objects
             .filter(published_at__isnull=False)
+            .annotate(short_body=Substr("body", 1, 200))
+            .only("pk", "title", "published_at")
             .order_by("-published_at")[:5]
         )
 
@@ -31,4 +35,4 @@ class LatestArticlesFeed(Feed):
         return item.title
 
     def item_description(self, item: Article):
-        return item.body[:200]
\ No newline at end of file
+        return item.short_body or ""
@@ -0,0 +1,335 @@
+"""
+Двухуровневый кэш: LRU в памяти процесса перед общим кэшем.
+
+L1 - ограниченный ``L1_MAX_ENTRIES`` словарь в памяти воркера, записи
+живут не дольше ``L1_TIMEOUT`` секунд. L2 - общий для всех воркеров кэш
+из ``CACHES`` (``SHARED_CACHE``, например FileBasedCache).
+
+Изменения ключей (set, delete, incr, смена версии, clear) публикуются
+в журнал инвалидаций: записи ``<prefix>:<n>`` с последовательными номерами
+в отдельном общем кэше ``LOG_CACHE``. Журнал держится отдельно от данных,
+чтобы его записи не вытесняли данные из L2. Воркер не чаще раза в ``SYNC_INTERVAL`` секунд дочитывает новые
+записи журнала и удаляет перечисленные ключи из своего L1. Если воркер
+отстал сильнее, чем хранится журнал, L1 очищается целиком.
+
+Статистика попаданий по уровням доступна через :meth:`TwoTierCache.stats`
+и в метриках ``/metrics/``.
+
+:class:`LockedFileBasedCache` - файловый кэш для L2 и журнала: ``add`` и
+``incr`` в нём атомарны между процессами (на них держатся счётчики
+поколений, блокировки ``get_or_compute`` и номера записей журнала),
+а каталог просматривается для очистки не при каждой записи, а раз
+в ``CULL_INTERVAL`` секунд.
+"""
+
+import os
+import pickle
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from hashlib import md5
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+
+SYNC_BATCH = 32
+CLEAR_ALL = "*"
+
+
+class TwoTierCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self.shared_alias = options.get("SHARED_CACHE", "shared")
+        self.log_alias = options.get("LOG_CACHE", self.shared_alias)
+        self.l1_max_entries = options.get("L1_MAX_ENTRIES", 1000)
+        self.l1_timeout = options.get("L1_TIMEOUT", 5)
+        self.sync_interval = options.get("SYNC_INTERVAL", 0.5)
+        self.log_timeout = options.get("LOG_TIMEOUT", 300)
+        self.log_prefix = options.get("LOG_PREFIX", "two-tier-invalidation")
+
+        self._l1 = OrderedDict()
+        self._lock = threading.RLock()
+        self._stats = Counter()
+        self._last_seq = None
+        self._next_sync = 0.0
+
+    @property
+    def shared(self) -> BaseCache:
+        return caches[self.shared_alias]
+
+    @property
+    def log(self) -> BaseCache:
+        return caches[self.log_alias]
+
+    # --- журнал инвалидаций
+
+    def _seq_key(self) -> str:
+        return f"{self.log_prefix}:seq"
+
+    def _log_key(self, seq: int) -> str:
+        return f"{self.log_prefix}:{seq}"
+
+    def _publish(self, keys) -> None:
+        keys = list(keys)
+        if not keys:
+            return
+        # номер резервируется атомарным incr, поэтому два воркера не пишут
+        # одну запись; читатель, обогнавший запись, просто очистит L1
+        self.log.add(self._seq_key(), 0, None)
+        seq = self.log.incr(self._seq_key())
+        self.log.set(self._log_key(seq), keys, self.log_timeout)
+        with self._lock:
+            # собственные записи уже применены к L1
+            if self._last_seq is not None and self._last_seq == seq - 1:
+                self._last_seq = seq
+
+    def _sync(self) -> None:
+        now = time.monotonic()
+        if now < self._next_sync:
+            return
+        self._next_sync = now + self.sync_interval
+
+        latest = self.log.get(self._seq_key(), 0)
+        with self._lock:
+            if self._last_seq is None:
+                self._last_seq = latest
+                return
+            if latest < self._last_seq:
+                # журнал очищен и начался заново
+                self._clear_l1()
+                self._last_seq = latest
+                return
+
+        seq = self._last_seq
+        while seq < latest:
+            log_keys = [self._log_key(n) for n in range(seq + 1, min(seq + SYNC_BATCH, latest) + 1)]
+            entries = self.log.get_many(log_keys)
+            with self._lock:
+                for log_key in log_keys:
+                    if log_key not in entries:
+                        # записи журнала истекли - неизвестно, что менялось
+                        self._clear_l1()
+                        self._last_seq = latest
+                        return
+                    self._evict(entries[log_key])
+                    seq += 1
+                self._last_seq = seq
+
+    def _evict(self, keys) -> None:
+        for key in keys:
+            if key == CLEAR_ALL:
+                self._clear_l1()
+                return
+            if self._l1.pop(key, None) is not None:
+                self._stats["l1_invalidations"] += 1
+
+    # --- L1
+
+    def _clear_l1(self) -> None:
+        self._stats["l1_invalidations"] += len(self._l1)
+        self._l1.clear()
+
+    def _l1_get(self, key):
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return None
+            expires, pickled = entry
+            if expires <= time.monotonic():
+                del self._l1[key]
+                return None
+            self._l1.move_to_end(key)
+            return pickled
+
+    def _l1_set(self, key, value, timeout=DEFAULT_TIMEOUT) -> None:
+        timeout = self.get_backend_timeout(timeout)
+        ttl = self.l1_timeout if timeout is None else min(timeout - time.time(), self.l1_timeout)
+        if ttl <= 0:
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._l1[key] = (time.monotonic() + ttl, pickled)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_max_entries:
+                self._l1.popitem(last=False)
+                self._stats["l1_evictions"] += 1
+
+    def _l1_delete(self, key) -> None:
+        with self._lock:
+            self._l1.pop(key, None)
+
+    # --- API кэша
+
+    def get(self, key, default=None, version=None):
+        full_key = self.make_and_validate_key(key, version=version)
+        self._sync()
+        pickled = self._l1_get(full_key)
+        if pickled is not None:
+            self._stats["l1_hits"] += 1
+            return pickle.loads(pickled)
+        self._stats["l1_misses"] += 1
+
+        value = self.shared.get(full_key, self)
+        if value is self:
+            self._stats["l2_misses"] += 1
+            return default
+        self._stats["l2_hits"] += 1
+        self._l1_set(full_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        return {
+            key: value
+            for key in keys
+            if (value := self.get(key, self, version=version)) is not self
+        }
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        full_key = self.make_and_validate_key(key, version=version)
+        self.shared.set(full_key, value, self._shared_timeout(timeout))
+        self._l1_set(full_key, value, timeout)
+        self._publish([full_key])
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        full_keys = {}
+        for key, value in data.items():
+            full_key = self.make_and_validate_key(key, version=version)
+            full_keys[full_key] = value
+        self.shared.set_many(full_keys, self._shared_timeout(timeout))
+        for full_key, value in full_keys.items():
+            self._l1_set(full_key, value, timeout)
+        self._publish(full_keys)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        full_key = self.make_and_validate_key(key, version=version)
+        if not self.shared.add(full_key, value, self._shared_timeout(timeout)):
+            return False
+        self._l1_set(full_key, value, timeout)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        full_key = self.make_and_validate_key(key, version=version)
+        self._l1_delete(full_key)
+        return self.shared.touch(full_key, self._shared_timeout(timeout))
+
+    def delete(self, key, version=None):
+        full_key = self.make_and_validate_key(key, version=version)
+        self._l1_delete(full_key)
+        deleted = self.shared.delete(full_key)
+        self._publish([full_key])
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        full_keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        for full_key in full_keys:
+            self._l1_delete(full_key)
+        self.shared.delete_many(full_keys)
+        self._publish(full_keys)
+
+    def has_key(self, key, version=None):
+        full_key = self.make_and_validate_key(key, version=version)
+        self._sync()
+        return self._l1_get(full_key) is not None or self.shared.has_key(full_key)
+
+    def incr(self, key, delta=1, version=None):
+        full_key = self.make_and_validate_key(key, version=version)
+        self._l1_delete(full_key)
+        value = self.shared.incr(full_key, delta)
+        self._publish([full_key])
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._clear_l1()
+        self.shared.clear()
+        self._publish([CLEAR_ALL])
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    def _shared_timeout(self, timeout):
+        # ключи уже собраны с префиксом и версией, L2 хранит их как есть
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "l1": {
+                    "hits": self._stats["l1_hits"],
+                    "misses": self._stats["l1_misses"],
+                    "entries": len(self._l1),
+                    "evictions": self._stats["l1_evictions"],
+                    "invalidations": self._stats["l1_invalidations"],
+                },
+                "l2": {
+                    "hits": self._stats["l2_hits"],
+                    "misses": self._stats["l2_misses"],
+                },
+            }
+
+
+class LockedFileBasedCache(FileBasedCache):
+    """
+    FileBasedCache с атомарными ``add`` и ``incr``: проверка и запись
+    выполняются под блокировкой файла (одного из ``LOCK_STRIPES``
+    в каталоге кэша), которую ОС снимает и при падении процесса.
+    """
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        options = params.get("OPTIONS", {})
+        self._lock_stripes = options.get("LOCK_STRIPES", 64)
+        self._cull_interval = options.get("CULL_INTERVAL", 300)
+        self._next_cull = 0.0
+
+    @contextmanager
+    def _file_lock(self, fname):
+        self._createdir()
+        stripe = int(md5(fname.encode(), usedforsecurity=False).hexdigest(), 16) % self._lock_stripes
+        with open(os.path.join(self._dir, f"{stripe}.lock"), "ab") as lock_file:
+            locks.lock(lock_file, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(lock_file)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._file_lock(self._key_to_file(key, version)):
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        fname = self._key_to_file(key, version)
+        with self._file_lock(fname):
+            try:
+                with open(fname, "rb") as f:
+                    expiry = pickle.load(f)
+                    value = pickle.loads(zlib.decompress(f.read()))
+            except (FileNotFoundError, EOFError):
+                expiry = value = None
+            if value is None or (expiry is not None and expiry < time.time()):
+                raise ValueError("Key '%s' not found" % key)
+            value += delta
+            # срок жизни сохраняется: счётчики поколений живут без срока
+            timeout = None if expiry is None else expiry - time.time()
+            self.set(key, value, timeout, version)
+        return value
+
+    def _cull(self):
+        now = time.monotonic()
+        if now < self._next_cull:
+            return
+        self._next_cull = now + self._cull_interval
+        for fname in self._list_cache_files():
+            # _is_expired удаляет просроченный файл
+            try:
+                with open(fname, "rb") as f:
+                    self._is_expired(f)
+            except FileNotFoundError:
+                pass
+        super()._cull()
@@ -0,0 +1,156 @@
+"""
+Чтение с реплик БД с гарантией read-your-writes.
+
+Реплики перечислены в ``DATABASE_REPLICAS``. :class:`ReplicaRouter` отправляет
+на случайную реплику только чтения внутри представлений, помеченных
+:func:`use_replica` (списки, детальные страницы, выгрузки); все остальные
+чтения, чтения сессий и пользователей (``PRIMARY_ONLY_APPS``) и все записи
+идут в ``default``.
+
+После первой записи запрос закрепляется за основной БД, а
+:class:`ReplicaPinningMiddleware` ставит cookie, с которой следующие
+запросы клиента ещё ``REPLICA_PIN_SECONDS`` секунд читают тоже из основной
+БД - пока реплики не догонят. Небезопасные методы (POST, PUT, ...)
+закрепляются сразу.
+
+Данные, которые кладутся в кэш с поколениями (см. :mod:`shopapp.cache`),
+читаются из основной БД (:func:`use_primary`): иначе отставшая реплика
+попала бы в кэш под уже новым поколением.
+
+Потоковые ответы (``StreamingHttpResponse``) читаются из БД уже после
+выхода из представления, поэтому их итератор выполняется с тем же
+состоянием маршрутизации, что и представление.
+"""
+
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+PRIMARY = "default"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+# сессия и пользователь загружаются лениво, уже внутри представления,
+# и только что выполненный вход не должен теряться из-за отставания реплик
+PRIMARY_ONLY_APPS = ("auth", "sessions", "contenttypes")
+
+_state = ContextVar("db_routing_state", default=None)
+
+
+class RoutingState:
+    __slots__ = ("replica_reads", "pinned", "written")
+
+    def __init__(self, pinned=False):
+        self.replica_reads = False
+        self.pinned = pinned
+        self.written = False
+
+
+def get_state() -> RoutingState:
+    # вне запроса состояние не сохраняется: чтения идут в основную БД
+    state = _state.get()
+    return state if state is not None else RoutingState()
+
+
+def get_replicas() -> list:
+    return list(getattr(settings, "DATABASE_REPLICAS", []))
+
+
+def _iterate_with_state(iterator, state: RoutingState, replica_reads: bool):
+    iterator = iter(iterator)
+    while True:
+        # состояние ставится только на время одного шага, чтобы не утекло
+        # к коду, который потребляет ответ
+        token = _state.set(state)
+        previous = state.replica_reads
+        state.replica_reads = replica_reads
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            state.replica_reads = previous
+            _state.reset(token)
+        yield chunk
+
+
+def _replica_reads(enabled: bool):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            state = _state.get()
+            token = None
+            if state is None:
+                state = RoutingState()
+                token = _state.set(state)
+            previous = state.replica_reads
+            state.replica_reads = enabled
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                state.replica_reads = previous
+                if token is not None:
+                    _state.reset(token)
+            if getattr(result, "streaming", False) and not result.is_async:
+                result.streaming_content = _iterate_with_state(result.streaming_content, state, enabled)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+use_replica = _replica_reads(True)
+use_replica.__doc__ = "Разрешает чтение с реплик внутри представления."
+
+use_primary = _replica_reads(False)
+use_primary.__doc__ = "Читает из основной БД даже внутри :func:`use_replica`."
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = get_state()
+        replicas = get_replicas()
+        if not replicas or state.pinned or not state.replica_reads:
+            return PRIMARY
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = get_state()
+        state.pinned = True
+        state.written = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaPinningMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        cookie = getattr(settings, "REPLICA_PIN_COOKIE", "use_primary")
+        state = RoutingState(
+            pinned=request.method not in SAFE_METHODS or cookie in request.COOKIES,
+        )
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.written and get_replicas():
+            response.set_cookie(
+                cookie,
+                "1",
+                max_age=getattr(settings, "REPLICA_PIN_SECONDS", 5),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
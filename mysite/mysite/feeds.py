@@ -0,0 +1,54 @@
+"""
+RSS-ленты с кэшированием готовых байтов.
+
+Лента рендерится один раз и хранится в кэше под ключом с поколениями
+моделей (см. :mod:`shopapp.cache`), поэтому сбрасывается сразу после
+изменения товаров или статей. ETag и Last-Modified позволяют читателям
+лент получать 304 без повторной загрузки.
+"""
+
+import hashlib
+
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from shopapp.cache import make_generation_key
+
+from .metrics import record_cache_lookup
+
+
+class CachedFeed(Feed):
+    generations = ()
+    cache_timeout = 60 * 60 * 24
+
+    def get_cache_key(self, request) -> str:
+        return make_generation_key(f"feed:{request.path}", *self.generations)
+
+    def __call__(self, request, *args, **kwargs):
+        cache_key = self.get_cache_key(request)
+        entry = cache.get(cache_key)
+        record_cache_lookup(entry is not None)
+        if entry is None:
+            response = super().__call__(request, *args, **kwargs)
+            entry = {
+                "content": response.content,
+                "content_type": response["Content-Type"],
+                "etag": quote_etag(hashlib.md5(response.content).hexdigest()),
+                "last_modified": int(timezone.now().timestamp()),
+            }
+            cache.set(cache_key, entry, self.cache_timeout)
+
+        response = get_conditional_response(
+            request,
+            etag=entry["etag"],
+            last_modified=entry["last_modified"],
+        )
+        if response is None:
+            response = HttpResponse(entry["content"], content_type=entry["content_type"])
+        response["ETag"] = entry["etag"]
+        response["Last-Modified"] = http_date(entry["last_modified"])
+        return response
@@ -0,0 +1,385 @@
+"""
+Метрики запросов в формате Prometheus.
+
+:class:`MetricsMiddleware` для каждого запроса считает время ответа,
+число и время SQL-запросов (через ``connection.execute_wrapper``),
+попадания и промахи кэша и размер ответа, и складывает их в счётчики
+и гистограммы по маршруту (``view_name``). Одинаковые SQL-запросы,
+повторённые в одном запросе ``METRICS_N_PLUS_ONE_THRESHOLD`` и более раз,
+пишутся в лог как возможный N+1.
+
+Метрики копятся в памяти процесса. Если задан ``METRICS_MULTIPROCESS_DIR``,
+каждый воркер раз в ``METRICS_FLUSH_INTERVAL`` секунд сохраняет свои
+счётчики в файл ``<pid>.json`` этого каталога, а :func:`metrics_view`
+складывает файлы всех воркеров - иначе каждый опрос видел бы счётчики
+случайного воркера. Файлы завершившихся воркеров не удаляются, чтобы
+счётчики не уменьшались; при деплое каталог можно очистить.
+
+Отдаются метрики только персоналу и адресам из ``METRICS_ALLOWED_IPS``.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+UNRESOLVED_ROUTE = "<unresolved>"
+
+_current_stats = ContextVar("metrics_request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}
+
+    def observe(self, label_values, value) -> None:
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def merge(self, label_values, series) -> None:
+        current = self.values.setdefault(label_values, [0] * (len(self.buckets) + 1) + [0.0])
+        for index, value in enumerate(series):
+            current[index] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for label_values, series in sorted(self.values.items()):
+            labels = _format_labels(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                bucket_labels = _format_labels(
+                    self.labels + ("le",), label_values + (str(bound),)
+                )
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            yield f"{self.name}_sum{labels} {series[-1]}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class CounterMetric:
+    def __init__(self, name: str, documentation: str, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = Counter()
+
+    def inc(self, label_values, value=1) -> None:
+        self.values[label_values] += value
+
+    def merge(self, label_values, value) -> None:
+        self.values[label_values] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in sorted(self.values.items()):
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = CounterMetric(
+            "django_http_requests_total",
+            "Total HTTP requests by route, method and status.",
+            ("route", "method", "status"),
+        )
+        self.latency = Histogram(
+            "django_http_request_duration_seconds",
+            "Time spent in the view and middlewares.",
+            ("route", "method"),
+            LATENCY_BUCKETS,
+        )
+        self.response_size = Histogram(
+            "django_http_response_size_bytes",
+            "Size of non-streaming responses.",
+            ("route",),
+            SIZE_BUCKETS,
+        )
+        self.queries = Histogram(
+            "django_db_queries_per_request",
+            "Number of SQL queries per request.",
+            ("route",),
+            QUERIES_BUCKETS,
+        )
+        self.query_seconds = CounterMetric(
+            "django_db_query_duration_seconds_total",
+            "Total time spent in SQL queries.",
+            ("route",),
+        )
+        self.cache = CounterMetric(
+            "django_cache_requests_total",
+            "Cache lookups by route and result.",
+            ("route", "result"),
+        )
+        self.compute_events = CounterMetric(
+            "django_cache_compute_events_total",
+            "get_or_compute outcomes: hit, miss, early_refresh, stale, waited, wait_timeout.",
+            ("name", "event"),
+        )
+        self.duplicates = CounterMetric(
+            "django_db_duplicate_queries_total",
+            "Requests with a SQL statement repeated N+1 style.",
+            ("route",),
+        )
+        self.cache_tiers = CounterMetric(
+            "django_cache_tier_requests_total",
+            "Cache lookups by cache tier.",
+            ("cache", "tier", "result"),
+        )
+        self.dirty = False
+        self.flusher_pid = None
+
+    @property
+    def metrics(self):
+        return (
+            self.requests,
+            self.latency,
+            self.response_size,
+            self.queries,
+            self.query_seconds,
+            self.cache,
+            self.compute_events,
+            self.duplicates,
+            self.cache_tiers,
+        )
+
+    def record(self, route: str, request, response, stats, duration: float) -> None:
+        with self.lock:
+            self.requests.inc((route, request.method, str(response.status_code)))
+            self.latency.observe((route, request.method), duration)
+            if not response.streaming:
+                self.response_size.observe((route,), len(response.content))
+            self.queries.observe((route,), stats.queries)
+            self.query_seconds.inc((route,), stats.query_time)
+            if stats.cache_hits:
+                self.cache.inc((route, "hit"), stats.cache_hits)
+            if stats.cache_misses:
+                self.cache.inc((route, "miss"), stats.cache_misses)
+            if stats.duplicates:
+                self.duplicates.inc((route,))
+        self.changed()
+
+    def record_compute_event(self, name: str, event: str) -> None:
+        with self.lock:
+            self.compute_events.inc((name, event))
+        self.changed()
+
+    def update_cache_tiers(self) -> None:
+        """Переносит статистику уровней кэшей (см. mysite.cache_backends)."""
+        values = Counter()
+        for alias in settings.CACHES:
+            stats = getattr(caches[alias], "stats", None)
+            if stats is None:
+                continue
+            for tier, tier_stats in stats().items():
+                for result in ("hits", "misses"):
+                    values[(alias, tier, result)] = tier_stats[result]
+        with self.lock:
+            self.cache_tiers.values = values
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                metric.name: [[list(label_values), value] for label_values, value in metric.values.items()]
+                for metric in self.metrics
+            }
+
+    def merge(self, snapshot: dict) -> None:
+        with self.lock:
+            for metric in self.metrics:
+                for label_values, value in snapshot.get(metric.name, ()):
+                    metric.merge(tuple(label_values), value)
+
+    # --- общий каталог воркеров
+
+    def changed(self) -> None:
+        self.dirty = True
+        directory = getattr(settings, "METRICS_MULTIPROCESS_DIR", None)
+        if directory and self.flusher_pid != os.getpid():
+            # после fork поток нужно запустить заново в каждом воркере
+            self.flusher_pid = os.getpid()
+            threading.Thread(
+                target=self._flush_loop,
+                args=(Path(directory),),
+                name="metrics-flush",
+                daemon=True,
+            ).start()
+
+    def _flush_loop(self, directory: Path) -> None:
+        interval = getattr(settings, "METRICS_FLUSH_INTERVAL", 1.0)
+        while True:
+            time.sleep(interval)
+            if not self.dirty:
+                continue
+            self.dirty = False
+            try:
+                self.flush(directory)
+            except OSError:
+                log.exception("Failed to write metrics to %s", directory)
+
+    def flush(self, directory: Path) -> None:
+        self.update_cache_tiers()
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{os.getpid()}.json"
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.snapshot()))
+        os.replace(tmp_path, path)
+
+    def render(self) -> str:
+        with self.lock:
+            lines = [line for metric in self.metrics for line in metric.render()]
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self.lock:
+            for metric in self.metrics:
+                metric.values.clear()
+
+
+registry = MetricsRegistry()
+
+
+class RequestStats:
+    __slots__ = ("queries", "query_time", "statements", "cache_hits", "cache_misses", "duplicates")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.statements = Counter()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.duplicates = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_time += time.perf_counter() - start
+            self.queries += 1
+            self.statements[sql] += 1
+
+
+def record_cache_lookup(hit: bool) -> None:
+    """Учитывает обращение к кэшу в метриках текущего запроса."""
+    stats = _current_stats.get()
+    if stats is None:
+        return
+    if hit:
+        stats.cache_hits += 1
+    else:
+        stats.cache_misses += 1
+
+
+def get_route(request) -> str:
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return UNRESOLVED_ROUTE
+    return match.view_name or match.route or UNRESOLVED_ROUTE
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = getattr(settings, "METRICS_N_PLUS_ONE_THRESHOLD", 5)
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        duration = time.perf_counter() - start
+
+        match = getattr(request, "resolver_match", None)
+        if match is not None and getattr(match.func, "metrics_exempt", False):
+            return response
+
+        route = get_route(request)
+        stats.duplicates = {
+            sql: count
+            for sql, count in stats.statements.items()
+            if count >= self.threshold
+        }
+        for sql, count in stats.duplicates.items():
+            log.warning("Possible N+1 on %s: %d x %s", route, count, sql)
+        registry.record(route, request, response, stats, duration)
+        return response
+
+
+def collect_metrics() -> MetricsRegistry:
+    """Метрики всех воркеров из ``METRICS_MULTIPROCESS_DIR`` или только этого процесса."""
+    directory = getattr(settings, "METRICS_MULTIPROCESS_DIR", None)
+    if not directory:
+        registry.update_cache_tiers()
+        return registry
+    directory = Path(directory)
+    registry.flush(directory)
+    total = MetricsRegistry()
+    for path in directory.glob("*.json"):
+        try:
+            total.merge(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            # файл воркера заменяется прямо сейчас
+            log.warning("Skipped unreadable metrics file %s", path)
+    return total
+
+
+def _is_allowed(request) -> bool:
+    user = getattr(request, "user", None)
+    if user and user.is_staff:
+        return True
+    return request.META.get("REMOTE_ADDR") in getattr(settings, "METRICS_ALLOWED_IPS", ())
+
+
+def metrics_view(request):
+    if not _is_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        collect_metrics().render(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+metrics_view.metrics_exempt = True
@@ -0,0 +1,181 @@
+"""
+Профилирование отдельных запросов на боевом сервере.
+
+:class:`ProfilerMiddleware` профилирует запрос, только если он помечен
+параметром ``?profile=`` от пользователя из персонала или заголовком
+``X-Profile`` с подписанным токеном (:func:`make_profile_token`).
+Остальные запросы проходят без накладных расходов, кроме проверки
+параметра и заголовка.
+
+Режимы:
+
+* ``cprofile`` - детерминированный cProfile, результат в ``.prof``
+  (открывается snakeviz, ``python -m pstats``);
+* ``sample`` - выборочный профилировщик: отдельный поток раз в
+  ``PROFILING_SAMPLE_INTERVAL`` секунд снимает стек потока запроса,
+  результат - свёрнутые стеки ``.folded`` для flamegraph.pl/speedscope.
+
+Файлы пишутся в ``PROFILING_ROOT``, список последних доступен
+персоналу в :func:`profiles_list_view`.
+"""
+
+import cProfile
+import os
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core import signing
+from django.http import FileResponse, Http404, JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .metrics import get_route
+
+PROFILE_PARAM = "profile"
+PROFILE_HEADER = "HTTP_X_PROFILE"
+TOKEN_SALT = "mysite.profiling"
+MODES = ("cprofile", "sample")
+
+
+def get_profiling_root() -> Path:
+    return Path(getattr(settings, "PROFILING_ROOT", settings.BASE_DIR / "profiles"))
+
+
+def make_profile_token() -> str:
+    """Подписанный токен для заголовка X-Profile."""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign("profile")
+
+
+def check_profile_token(token: str) -> bool:
+    max_age = getattr(settings, "PROFILING_TOKEN_MAX_AGE", 60 * 60)
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=max_age)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+class StackSampler:
+    """Снимает стек одного потока с заданным интервалом."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path: Path):
+        with open(path, "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+class ProfilerMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def get_mode(self, request):
+        mode = request.GET.get(PROFILE_PARAM)
+        token = request.META.get(PROFILE_HEADER)
+        if mode is None and token is None:
+            return None
+        if token is not None:
+            if not check_profile_token(token):
+                return None
+        elif not request.user.is_staff:
+            return None
+        if mode not in MODES:
+            mode = getattr(settings, "PROFILING_MODE", "cprofile")
+        return mode
+
+    def __call__(self, request):
+        mode = self.get_mode(request)
+        if mode is None:
+            return self.get_response(request)
+
+        if mode == "sample":
+            profiler = StackSampler(
+                threading.get_ident(),
+                getattr(settings, "PROFILING_SAMPLE_INTERVAL", 0.005),
+            )
+            profiler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.stop()
+        else:
+            profiler = cProfile.Profile()
+            response = profiler.runcall(self.get_response, request)
+
+        root = get_profiling_root()
+        root.mkdir(parents=True, exist_ok=True)
+        name = "{}-{}.{}".format(
+            timezone.now().strftime("%Y%m%d-%H%M%S-%f"),
+            slugify(get_route(request).replace(":", "-")) or "request",
+            "folded" if mode == "sample" else "prof",
+        )
+        if mode == "sample":
+            profiler.dump(root / name)
+        else:
+            profiler.dump_stats(root / name)
+        response["X-Profile-Name"] = name
+        return response
+
+
+@staff_member_required
+def profiles_list_view(request):
+    root = get_profiling_root()
+    limit = getattr(settings, "PROFILING_LIST_LIMIT", 50)
+    files = sorted(
+        (path for path in root.glob("*") if path.suffix in (".prof", ".folded")),
+        key=lambda path: path.stat().st_mtime,
+        reverse=True,
+    ) if root.is_dir() else []
+    return JsonResponse({
+        "token": make_profile_token(),
+        "profiles": [
+            {
+                "name": path.name,
+                "size": path.stat().st_size,
+                "created": datetime.fromtimestamp(
+                    path.stat().st_mtime, tz=timezone.get_current_timezone(),
+                ).isoformat(),
+                "url": reverse("profile_download", kwargs={"name": path.name}),
+            }
+            for path in files[:limit]
+        ],
+    })
+
+
+@staff_member_required
+def profile_download_view(request, name: str):
+    path = get_profiling_root() / name
+    if path.name != name or path.suffix not in (".prof", ".folded") or not path.is_file():
+        raise Http404("Profile not found")
+    return FileResponse(open(path, "rb"), as_attachment=True, filename=name)
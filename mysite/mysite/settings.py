@@ -66,7 +66,6 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'django.contrib.sitemaps',
 
-    'debug_toolbar',
     'rest_framework',
     'django_filters',
     'drf_spectacular',
@@ -80,20 +79,27 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mysite.metrics.MetricsMiddleware',
+    'mysite.db_routers.ReplicaPinningMiddleware',
     # 'django.middleware.cache.UpdateCacheMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'mysite.profiling.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.contrib.admindocs.middleware.XViewMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
     # 'django.middleware.cache.FetchFromCacheMiddleware',
 ]
 
+# debug_toolbar - только для разработки
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'mysite.urls'
 
 TEMPLATES = [
@@ -125,13 +131,48 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения (см. mysite.db_routers):
+# DJANGO_DB_REPLICAS="/path/replica1.sqlite3,/path/replica2.sqlite3".
+# Реплики и кэши для тестов - в mysite.test_settings.
+DATABASE_REPLICAS = []
+replica_names = [name for name in getenv("DJANGO_DB_REPLICAS", "").split(",") if name]
+for number, name in enumerate(replica_names, start=1):
+    DATABASES[f"replica{number}"] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+    }
+    DATABASE_REPLICAS.append(f"replica{number}")
+
+DATABASE_ROUTERS = ['mysite.db_routers.ReplicaRouter']
+REPLICA_PIN_COOKIE = "use_primary"
+REPLICA_PIN_SECONDS = 5
+
 
+# default - LRU в памяти воркера перед общим для всех воркеров файловым кэшем
+# (см. mysite.cache_backends). Журнал инвалидаций лежит в отдельном кэше,
+# а у кэша данных большой MAX_ENTRIES: при вытеснении удаляются случайные
+# записи. Просроченные файлы вычищаются раз в CULL_INTERVAL секунд.
+CACHE_DIR = Path(getenv("DJANGO_CACHE_DIR", BASE_DIR / "cache"))
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.dummy.DummyCache",
-        # "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
-        # "LOCATION": "/var/tmp/django_cache",
-        # "LOCATION": "c:/foo/bar",
+        "BACKEND": "mysite.cache_backends.TwoTierCache",
+        "OPTIONS": {
+            "SHARED_CACHE": "shared",
+            "LOG_CACHE": "invalidation",
+            "L1_MAX_ENTRIES": 1000,
+            "L1_TIMEOUT": 5,
+            "SYNC_INTERVAL": 0.5,
+        },
+    },
+    "shared": {
+        "BACKEND": "mysite.cache_backends.LockedFileBasedCache",
+        "LOCATION": CACHE_DIR / "data",
+        "OPTIONS": {"MAX_ENTRIES": 1_000_000, "CULL_INTERVAL": 300},
+    },
+    "invalidation": {
+        "BACKEND": "mysite.cache_backends.LockedFileBasedCache",
+        "LOCATION": CACHE_DIR / "invalidation",
+        "OPTIONS": {"MAX_ENTRIES": 100_000, "CULL_INTERVAL": 60},
     },
 }
 
@@ -170,6 +211,15 @@ SPECTACULAR_SETTINGS = {
     'SERVE_INCLUDE_SCHEMA': False,
 }
 
+SHOP_IMPORT_JOB_WORKERS = int(getenv("SHOP_IMPORT_JOB_WORKERS", "2"))
+SHOP_IMPORT_JOBS_EAGER = False
+SHOP_IMPORT_JOB_STALE_SECONDS = 3600
+SHOP_ROLLUP_LAG = 60
+SHOP_ROLLUP_WINDOW_DAYS = 2
+SHOP_THUMBNAIL_WIDTHS = (160, 320, 640)
+SHOP_THUMBNAIL_WORKERS = int(getenv("SHOP_THUMBNAIL_WORKERS", "2"))
+SHOP_THUMBNAILS_EAGER = False
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -201,6 +251,32 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'uploads'
 
+SITEMAPS_ROOT = BASE_DIR / "sitemaps"
+SITEMAPS_DOMAIN = getenv("DJANGO_SITEMAPS_DOMAIN", "127.0.0.1:8000")
+SITEMAPS_PROTOCOL = getenv("DJANGO_SITEMAPS_PROTOCOL", "https")
+
+# Отдача защищённых файлов веб-сервером: None, "nginx" или "apache"
+SHOP_SENDFILE_BACKEND = getenv("SHOP_SENDFILE_BACKEND") or None
+SHOP_SENDFILE_PREFIX = "/protected-media/"
+
+# Метрики Prometheus: кроме персонала /metrics/ доступен только адресам
+# из DJANGO_METRICS_ALLOWED_IPS (за локальным прокси любой запрос приходит
+# с 127.0.0.1, поэтому INTERNAL_IPS здесь не подходит). Счётчики воркеров
+# складываются через общий каталог.
+METRICS_ALLOWED_IPS = [ip for ip in getenv("DJANGO_METRICS_ALLOWED_IPS", "").split(",") if ip]
+METRICS_MULTIPROCESS_DIR = Path(getenv("DJANGO_METRICS_DIR", BASE_DIR / "metrics"))
+METRICS_FLUSH_INTERVAL = 1.0
+METRICS_N_PLUS_ONE_THRESHOLD = 5
+
+# Профилирование запросов (?profile= для персонала или заголовок X-Profile)
+PROFILING_ROOT = BASE_DIR / "profiles"
+PROFILING_MODE = "cprofile"
+PROFILING_SAMPLE_INTERVAL = 0.005
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+
+# Базовый замер команды bench
+BENCH_BASELINE = BASE_DIR / "bench-baseline.json"
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
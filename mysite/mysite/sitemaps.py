@@ -1,7 +1,123 @@
+"""
+Карты сайта.
+
+Команда ``generate_sitemaps`` заранее пишет на диск (``SITEMAPS_ROOT``)
+индекс ``sitemap.xml`` и файлы секций ``sitemap-<секция>-<страница>.xml``.
+Перезаписываются только страницы, у которых изменились lastmod или состав;
+файлы заменяются целиком (``os.replace``), чтобы не отдать недописанный.
+Представления ниже отдают готовые файлы, а если их ещё нет -
+строят карту сайта на лету стандартными view Django.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.contrib.sitemaps.views import SitemapIndexItem, sitemap
+from django.http import FileResponse, Http404
+from django.template.loader import render_to_string
+from django.utils import translation
+
 from blogapp.sitemap import BlogSitemap
 from shopapp.sitemap import ShopSitemap
 
 sitemaps = {
     "blog": BlogSitemap,
     "shop": ShopSitemap,
-}
\ No newline at end of file
+}
+
+MANIFEST_NAME = "manifest.json"
+
+
+def section_filename(section: str, page: int) -> str:
+    return f"sitemap-{section}-{page}.xml"
+
+
+def _write_file(path, content: str) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with open(fd, "w", encoding="utf-8") as file:
+            file.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _page_fingerprint(site, page: int) -> tuple:
+    items = site.paginator.page(page).object_list
+    lastmods = [site.lastmod(item) for item in items]
+    data = [(item.pk, lastmod.isoformat() if lastmod else None) for item, lastmod in zip(items, lastmods)]
+    digest = hashlib.md5(json.dumps(data).encode()).hexdigest()
+    latest = max((lastmod for lastmod in lastmods if lastmod), default=None)
+    return digest, latest
+
+
+def generate_sitemaps(root=None, domain=None, protocol=None) -> dict:
+    """
+    Пишет файлы карты сайта и возвращает статистику:
+    сколько страниц записано и сколько пропущено без изменений.
+    """
+    root = root or settings.SITEMAPS_ROOT
+    root.mkdir(parents=True, exist_ok=True)
+    site = SimpleNamespace(domain=domain or settings.SITEMAPS_DOMAIN)
+    protocol = protocol or settings.SITEMAPS_PROTOCOL
+
+    manifest_path = root / MANIFEST_NAME
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+    new_manifest = {}
+    written = skipped = 0
+    index_items = []
+
+    language = translation.get_supported_language_variant(settings.LANGUAGE_CODE)
+    with translation.override(language):
+        for section, sitemap_class in sitemaps.items():
+            site_map = sitemap_class()
+            for page in site_map.paginator.page_range:
+                filename = section_filename(section, page)
+                digest, latest = _page_fingerprint(site_map, page)
+                new_manifest[filename] = digest
+                index_items.append(SitemapIndexItem(
+                    f"{protocol}://{site.domain}/{filename}",
+                    latest,
+                ))
+                if manifest.get(filename) == digest and (root / filename).exists():
+                    skipped += 1
+                    continue
+                urls = site_map.get_urls(page=page, site=site, protocol=protocol)
+                _write_file(root / filename, render_to_string("sitemap.xml", {"urlset": urls}))
+                written += 1
+
+        _write_file(root / "sitemap.xml", render_to_string("sitemap_index.xml", {"sitemaps": index_items}))
+
+    # удаляем страницы, которых больше нет (например, после архивации товаров)
+    for filename in set(manifest) - set(new_manifest):
+        (root / filename).unlink(missing_ok=True)
+    _write_file(manifest_path, json.dumps(new_manifest, indent=2))
+    return {"written": written, "skipped": skipped, "pages": len(new_manifest)}
+
+
+def _serve_file(filename: str):
+    path = settings.SITEMAPS_ROOT / filename
+    if not path.exists():
+        return None
+    return FileResponse(path.open("rb"), content_type="application/xml")
+
+
+def sitemap_view(request):
+    response = _serve_file("sitemap.xml")
+    if response is None:
+        return sitemap(request, sitemaps=sitemaps)
+    return response
+
+
+def sitemap_section_view(request, section: str, page: int):
+    if section not in sitemaps:
+        raise Http404("No sitemap available for section: %r" % section)
+    response = _serve_file(section_filename(section, page))
+    if response is None:
+        raise Http404("Sitemap page is not generated yet")
+    return response
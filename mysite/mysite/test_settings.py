@@ -0,0 +1,42 @@
+"""
+Settings for running tests:
+
+    python manage.py test --settings=mysite.test_settings
+
+Replicas are separate SQLite files in the system temp directory (test
+runs must not leave files in ``database/``), and tests enable them via
+``override_settings(DATABASE_REPLICAS=...)``. The shared caches of the
+two-tier backend and metrics live only in the test process memory.
+"""
+
+import tempfile
+from pathlib import Path
+
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES, DATABASES
+
+REPLICA_DIR = Path(tempfile.gettempdir())
+
+DATABASES = {
+    "default": DATABASES["default"],
+    **{
+        f"replica{number}": {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': REPLICA_DIR / f'mysite-replica{number}.sqlite3',
+            'TEST': {'NAME': REPLICA_DIR / f'mysite-test_replica{number}.sqlite3'},
+        }
+        for number in (1, 2)
+    },
+}
+DATABASE_REPLICAS = []
+
+CACHES = {
+    **CACHES,
+    "shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "invalidation": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "invalidation",
+    },
+}
+
+METRICS_MULTIPROCESS_DIR = None
@@ -22,8 +22,9 @@ from django.conf.urls.i18n import i18n_patterns
 
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 
-from django.contrib.sitemaps.views import sitemap
-from .sitemaps import sitemaps
+from .metrics import metrics_view
+from .profiling import profiles_list_view, profile_download_view
+from .sitemaps import sitemap_view, sitemap_section_view
 
 urlpatterns = [
     path('api/', include('myapiapp.urls')),
@@ -32,13 +33,20 @@ urlpatterns = [
     path('api/schema/swagger/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger'),
     path('api/schema/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
     path('blog/', include('blogapp.urls')),
+    path('metrics/', metrics_view, name='metrics'),
+    path('profiles/', profiles_list_view, name='profiles_list'),
+    path('profiles/<str:name>', profile_download_view, name='profile_download'),
 
     path(
         "sitemap.xml",
-        sitemap,
-        {"sitemaps": sitemaps},
+        sitemap_view,
         name="django.contrib.sitemaps.views.sitemap",
     ),
+    path(
+        "sitemap-<slug:section>-<int:page>.xml",
+        sitemap_section_view,
+        name="sitemap-section",
+    ),
 ]
 
 urlpatterns += i18n_patterns(
@@ -4,10 +4,11 @@ from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render, redirect
 from django.urls import path
 
-from .common import save_csv_products
-from .models import Product, Order, ProductImage
-from .admin_mixins import ExportAsCSVMixin
+from .jobs import enqueue_import
+from .models import Product, Order, ProductImage, ImportJob
+from .admin_mixins import ExportAsCSVMixin, OrderProductsFormsetMixin
 from .forms import CSVImportForm, OrderImportForm
+from .search import search_products
 
 class OrderInLine(admin.TabularInline):
     model = Product.orders.through
@@ -24,7 +25,7 @@ def mark_unarchived(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset
     queryset.update(archived=False)
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
+class ProductAdmin(OrderProductsFormsetMixin, admin.ModelAdmin, ExportAsCSVMixin):
     change_list_template = "shopapp/products_changelist.html"
     actions = [
         mark_archived,
@@ -43,7 +44,7 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
     search_fields = "name", "description"
     fieldsets = [
         (None, {
-            "fields": ("name", "description"),
+            "fields": ("sku", "name", "description"),
         }),
         ("Price options", {
             "fields": ("price", "discount"),
@@ -59,6 +60,12 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
         }),
     ]
 
+    def get_search_results(self, request, queryset, search_term):
+        result = search_products(queryset, search_term)
+        if result is None:
+            return super().get_search_results(request, queryset, search_term)
+        return result, False
+
     def description_short(self, obj: Product) -> str:
         if len(obj.description) < 48:
             return obj.description
@@ -78,11 +85,13 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
             }
             return render(request, "admin/csv_form.html", context, status=400)
 
-        save_csv_products(
-            file=form.files["csv_file"].file,
+        job = enqueue_import(
+            ImportJob.KIND_PRODUCTS,
+            form.files["csv_file"],
             encoding=request.encoding,
+            user=request.user,
         )
-        self.message_user(request, "Data from CSV was imported")
+        self.message_user(request, f"Data from CSV was queued for import as job #{job.pk}")
         return redirect("..")
 
     def get_urls(self):
@@ -104,11 +113,12 @@ class ProductInLine(admin.StackedInline):
     model = Order.products.through
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(OrderProductsFormsetMixin, admin.ModelAdmin):
     inlines = [
         ProductInLine,
     ]
-    list_display = "delivery_address", "promocode", "created_at", "user_verbose"
+    list_display = "delivery_address", "promocode", "created_at", "user_verbose", "total", "products_count"
+    readonly_fields = "total", "products_count"
 
     def get_queryset(self, request):
         return Order.objects.select_related("user").prefetch_related("products")
@@ -127,20 +137,13 @@ class OrderAdmin(admin.ModelAdmin):
         if request.method == "POST":
             form = OrderImportForm(request.POST, request.FILES)
             if form.is_valid():
-                # Реализация парсинга файла
-                # Пример для CSV:
-                import csv
-                from io import TextIOWrapper
-                file = TextIOWrapper(request.FILES['file'].file, encoding=request.encoding)
-                reader = csv.DictReader(file)
-                for row in reader:
-                    order = Order.objects.create(
-                        user=request.user,
-                        delivery_address=row['address'],
-                        promocode=row['promocode']
-                    )
-                    products = Product.objects.filter(id__in=row['products'].split(','))
-                    order.products.set(products)
+                job = enqueue_import(
+                    ImportJob.KIND_ORDERS,
+                    request.FILES['file'],
+                    encoding=request.encoding,
+                    user=request.user,
+                )
+                self.message_user(request, f"Orders were queued for import as job #{job.pk}")
                 return redirect('admin:shopapp_order_changelist')
         else:
             form = OrderImportForm()
@@ -151,4 +154,11 @@ class OrderAdmin(admin.ModelAdmin):
     def changelist_view(self, request, extra_context=None):
         extra_context = extra_context or {}
         extra_context['title'] = "Импорт/Экспорт заказов"
-        return super().changelist_view(request, extra_context=extra_context)
\ No newline at end of file
+        return super().changelist_view(request, extra_context=extra_context)
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = "pk", "kind", "status", "rows", "imported", "failed", "user", "created_at", "finished_at"
+    list_filter = "kind", "status"
+    readonly_fields = "rows", "imported", "failed", "errors", "message", "started_at", "finished_at"
@@ -4,6 +4,8 @@ from django.db.models.options import Options
 from django.db.models import QuerySet
 from django.http import HttpRequest, HttpResponse
 
+from .models import Order, orders_changed
+
 
 class ExportAsCSVMixin:
     def export_csv(self, request: HttpRequest, queryset: QuerySet):
@@ -22,4 +24,24 @@ class ExportAsCSVMixin:
 
         return response
 
-    export_csv.short_description = "Export as CSV"
\ No newline at end of file
+    export_csv.short_description = "Export as CSV"
+
+
+class OrderProductsFormsetMixin:
+    """
+    Строки ``Order.products.through`` из инлайнов сохраняются напрямую, без
+    m2m_changed и post_save (модель создана автоматически), поэтому после
+    сохранения инлайна отправляется ``orders_changed`` для затронутых заказов.
+    """
+
+    def save_formset(self, request, form, formset, change):
+        super().save_formset(request, form, formset, change)
+        if formset.model is not Order.products.through:
+            return
+        order_pks = set()
+        for row_form in formset.forms:
+            if row_form.has_changed() or row_form in formset.deleted_forms:
+                order_pks.update((row_form.initial.get("order"), row_form.instance.order_id))
+        order_pks.discard(None)
+        if order_pks:
+            orders_changed.send(sender=Order, pks=list(order_pks))
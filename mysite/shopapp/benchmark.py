@@ -0,0 +1,140 @@
+"""
+Замеры скорости основных маршрутов магазина.
+
+Используется командой ``bench``: маршруты вызываются тестовым клиентом
+внутри процесса на заранее заполненных данных, для каждого считаются
+p50/p95 времени ответа и число SQL-запросов. Результат сравнивается
+с сохранённым базовым замером.
+"""
+
+import time
+from statistics import quantiles
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone, translation
+
+from blogapp.models import Article
+
+from .datagen import generate_shop_data
+from .models import Order, Product
+
+ROUTES = (
+    ("products_list", "shopapp:products_list", None),
+    ("product_details", "shopapp:product_details", "product"),
+    ("api_products_list", "shopapp:product-list", None),
+    ("api_product_detail", "shopapp:product-detail", "product"),
+    ("api_orders_list", "shopapp:order-list", None),
+    ("api_order_detail", "shopapp:order-detail", "order"),
+    ("products_export", "shopapp:products-export", None),
+    ("orders_export", "shopapp:orders-export", None),
+    ("products_feed", "shopapp:products-feed", None),
+    ("articles_feed", "blogapp:articles-feed", None),
+    ("sitemap_index", "django.contrib.sitemaps.views.sitemap", None),
+    ("sitemap_shop", "sitemap-section", "sitemap"),
+)
+
+
+def seed_dataset(products=500, orders=200, articles=50, seed=42) -> dict:
+    """Заполняет БД детерминированным набором данных для замеров."""
+    user, _ = User.objects.get_or_create(
+        username="bench",
+        defaults={"is_staff": True, "is_superuser": True},
+    )
+    generate_shop_data(products=products, orders=orders, seed=seed)
+    Article.objects.bulk_create(
+        [
+            Article(title=f"Article {i}", body="Bench article " * 20, published_at=timezone.now())
+            for i in range(articles)
+        ],
+        batch_size=500,
+    )
+    return {
+        "user": user,
+        "product": Product.objects.order_by("pk").first().pk,
+        "order": Order.objects.order_by("pk").first().pk,
+    }
+
+
+def _route_url(url_name: str, kwarg, context: dict) -> str:
+    if kwarg is None:
+        kwargs = {}
+    elif kwarg == "sitemap":
+        kwargs = {"section": "shop", "page": 1}
+    else:
+        kwargs = {"pk": context[kwarg]}
+    with translation.override("en"):
+        return reverse(url_name, kwargs=kwargs)
+
+
+def _percentiles(timings) -> tuple:
+    if len(timings) == 1:
+        return timings[0], timings[0]
+    cuts = quantiles(timings, n=20, method="inclusive")
+    return cuts[9], cuts[18]
+
+
+def run_benchmark(context: dict, iterations=20, warmup=2, names=None) -> dict:
+    """
+    Вызывает каждый маршрут ``warmup + iterations`` раз и возвращает
+    {имя: {"p50_ms", "p95_ms", "queries", "status"}}.
+    """
+    client = Client()
+    client.force_login(context["user"])
+    results = {}
+    for name, url_name, kwarg in ROUTES:
+        if names and name not in names:
+            continue
+        url = _route_url(url_name, kwarg, context)
+        for _ in range(warmup):
+            client.get(url)
+
+        timings = []
+        queries = 0
+        status = None
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = client.get(url)
+                if response.streaming:
+                    for _chunk in response.streaming_content:
+                        pass
+                timings.append((time.perf_counter() - start) * 1000)
+            queries = max(queries, len(captured))
+            status = response.status_code
+
+        p50, p95 = _percentiles(timings)
+        results[name] = {
+            "url": url,
+            "status": status,
+            "p50_ms": round(p50, 3),
+            "p95_ms": round(p95, 3),
+            "queries": queries,
+        }
+    return results
+
+
+def compare_with_baseline(results: dict, baseline: dict, threshold=0.5, min_delta_ms=2.0) -> list:
+    """
+    Ищет регрессии относительно базового замера: p95 выросло больше чем
+    на ``threshold`` (и не меньше чем на ``min_delta_ms``, чтобы не ловить
+    шум на быстрых маршрутах) или запросов к БД стало больше.
+    """
+    regressions = []
+    for name, base in baseline.items():
+        current = results.get(name)
+        if current is None:
+            continue
+        delta = current["p95_ms"] - base["p95_ms"]
+        if delta > base["p95_ms"] * threshold and delta > min_delta_ms:
+            regressions.append(
+                f"{name}: p95 {current['p95_ms']:.1f}ms > baseline {base['p95_ms']:.1f}ms"
+            )
+        if current["queries"] > base["queries"]:
+            regressions.append(
+                f"{name}: {current['queries']} queries > baseline {base['queries']}"
+            )
+    return regressions
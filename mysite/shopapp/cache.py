@@ -0,0 +1,161 @@
+"""
+Кэширование с поколениями (generation counters).
+
+Для каждой модели в кэше хранится счётчик поколения. Он входит в ключи
+закэшированных ответов и увеличивается при любом изменении данных модели,
+поэтому старые записи просто перестают использоваться, а не удаляются.
+
+Из сигналов поколение увеличивается только после фиксации транзакции
+(:func:`bump_generation_on_commit`): иначе параллельный запрос успел бы
+положить ещё старые данные под уже новым поколением.
+"""
+
+import hashlib
+import math
+import random
+import time
+import uuid
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+
+from mysite.metrics import record_cache_lookup, registry
+
+GENERATION_KEY = "generation:{name}"
+USER_ORDERS_EXPORT_KEY = "orders_export_{user_id}"
+
+
+def new_generation() -> int:
+    """
+    Начальное значение счётчика. Счётчик может пропасть из кэша (вытеснение,
+    рестарт, ``clear``), и новое значение не должно совпасть ни с одним из
+    прежних, иначе старые записи снова станут актуальными.
+    """
+    return time.time_ns()
+
+
+def get_generation(name: str) -> int:
+    key = GENERATION_KEY.format(name=name)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, new_generation(), timeout=None)
+        generation = cache.get(key)
+    return generation or new_generation()
+
+
+def bump_generation(name: str) -> None:
+    key = GENERATION_KEY.format(name=name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, new_generation(), timeout=None)
+
+
+def bump_generation_on_commit(name: str) -> None:
+    transaction.on_commit(partial(bump_generation, name))
+
+
+def normalize_query_params(query_params) -> str:
+    """
+    Приводит параметры запроса к каноническому виду: порядок параметров
+    и значений не важен, пустые значения отбрасываются.
+    """
+    items = sorted(
+        (key, value)
+        for key in query_params
+        for value in query_params.getlist(key)
+        if value != ""
+    )
+    return "&".join(f"{key}={value}" for key, value in items)
+
+
+def make_generation_key(prefix: str, *names: str) -> str:
+    generations = ".".join(str(get_generation(name)) for name in names)
+    return f"{prefix}:{generations}"
+
+
+def make_cache_key(prefix: str, request, *names: str) -> str:
+    parts = [
+        request.get_host(),
+        request.path,
+        normalize_query_params(request.GET),
+        getattr(getattr(request, "accepted_renderer", None), "format", "") or "",
+    ]
+    digest = hashlib.md5("|".join(parts).encode()).hexdigest()
+    return f"{make_generation_key(prefix, *names)}:{digest}"
+
+
+def user_orders_export_key(user_id) -> str:
+    return USER_ORDERS_EXPORT_KEY.format(user_id=user_id)
+
+
+def invalidate_user_orders_export(*user_ids) -> None:
+    cache.delete_many([user_orders_export_key(user_id) for user_id in set(user_ids)])
+
+
+def invalidate_user_orders_export_on_commit(*user_ids) -> None:
+    """Как и поколения, выгрузки сбрасываются только после фиксации транзакции."""
+    transaction.on_commit(partial(invalidate_user_orders_export, *set(user_ids)))
+
+
+def get_or_compute(key: str, producer, timeout: int, name: str = "", lock_timeout=30, wait_timeout=10, beta=1.0):
+    """
+    Значение из кэша или результат ``producer()`` без «лавины» пересчётов.
+
+    * Пересчитывает только тот, кто взял блокировку ``<key>:lock``
+      (``cache.add``, общая для всех воркеров). Остальные получают старое
+      значение, а если его нет - ждут до ``wait_timeout`` секунд.
+    * Значение хранится дольше ``timeout`` (ещё один ``timeout``), чтобы
+      было что отдавать во время пересчёта.
+    * Ключ обновляется заранее с вероятностью, растущей к концу срока
+      (XFetch): чем дольше считается значение и чем больше ``beta``,
+      тем раньше.
+
+    ``name`` - короткое имя для метрик (``django_cache_compute_events_total``).
+    """
+    name = name or key
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None:
+        early = entry["delta"] * beta * -math.log(random.random() or 1e-12)
+        if now + early < entry["expires"]:
+            _record(name, "hit", hit=True)
+            return entry["value"]
+
+    lock_key = f"{key}:lock"
+    token = uuid.uuid4().hex
+    if not cache.add(lock_key, token, lock_timeout):
+        if entry is not None:
+            _record(name, "stale" if now >= entry["expires"] else "hit", hit=True)
+            return entry["value"]
+        deadline = time.monotonic() + wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                _record(name, "waited", hit=True)
+                return entry["value"]
+        # держатель блокировки не успел - считаем сами
+        _record(name, "wait_timeout", hit=False)
+        return producer()
+
+    try:
+        _record(name, "miss" if entry is None else "early_refresh", hit=entry is not None)
+        start = time.time()
+        value = producer()
+        delta = time.time() - start
+        cache.set(
+            key,
+            {"value": value, "expires": time.time() + timeout, "delta": delta},
+            timeout * 2,
+        )
+        return value
+    finally:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def _record(name: str, event: str, hit: bool) -> None:
+    record_cache_lookup(hit)
+    registry.record_compute_event(name, event)
@@ -1,19 +1,313 @@
-from csv import DictReader
+from csv import DictReader, writer
 from io import TextIOWrapper
+from timeit import default_timer
 
-from shopapp.models import Product
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from rest_framework import serializers
 
+from shopapp.forms import ProductCSVRowForm
+from shopapp.models import Product, Order
+from shopapp.services import bulk_create_orders, resolve_product_ids
 
-def save_csv_products(file, encoding):
+
+class Echo:
+    """
+    Псевдо-буфер для csv.writer: вместо накопления строк
+    сразу возвращает записанное значение.
+    """
+
+    def write(self, value):
+        return value
+
+
+def stream_csv_rows(header, rows):
+    """
+    Генератор CSV: отдаёт заголовок и строки по одной,
+    не собирая весь файл в памяти.
+    """
+    csv_writer = writer(Echo())
+    yield csv_writer.writerow(header)
+    for row in rows:
+        yield csv_writer.writerow(row)
+
+
+def iter_orders_export(chunk_size=1000):
+    """
+    Данные заказов для выгрузки, по одному словарю на заказ.
+
+    Заказы читаются пачками по pk (keyset), id товаров для пачки берутся
+    одним запросом к промежуточной таблице - модели в память не грузятся.
+    """
+    last_pk = 0
+    while True:
+        orders = list(
+            Order.objects
+            .filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values("pk", "delivery_address", "promocode", "user_id")[:chunk_size]
+        )
+        if not orders:
+            return
+        last_pk = orders[-1]["pk"]
+
+        product_ids = {order["pk"]: [] for order in orders}
+        links = (
+            Order.products.through.objects
+            .filter(order_id__in=product_ids)
+            # тот же порядок, что у order.products.all() (Product.Meta.ordering)
+            .order_by("product__name", "product__price", "product_id")
+            .values_list("order_id", "product_id")
+        )
+        for order_pk, product_pk in links:
+            product_ids[order_pk].append(product_pk)
+
+        for order in orders:
+            yield {
+                "id": order["pk"],
+                "delivery_address": order["delivery_address"],
+                "promocode": order["promocode"],
+                "user_id": order["user_id"],
+                "product_ids": product_ids[order["pk"]],
+            }
+
+
+def build_user_orders_export(owner) -> dict:
+    """
+    Данные для export_user_orders: одним запросом values() по заказам
+    и одним запросом к промежуточной таблице за id товаров.
+    Формат совпадает с ModelSerializer(fields="__all__") для Order.
+    """
+    datetime_field = serializers.DateTimeField()
+    total_field = serializers.DecimalField(max_digits=10, decimal_places=2)
+    orders = list(
+        Order.objects
+        .filter(user=owner)
+        .order_by("pk")
+        .values(
+            "pk", "delivery_address", "promocode", "created_at", "updated_at",
+            "total", "products_count", "user_id", "receipt",
+        )
+    )
+    product_ids = {order["pk"]: [] for order in orders}
+    links = (
+        Order.products.through.objects
+        .filter(order__user=owner)
+        .order_by("product__name", "product__price", "product_id")
+        .values_list("order_id", "product_id")
+    )
+    for order_pk, product_pk in links:
+        product_ids[order_pk].append(product_pk)
+
+    return {
+        "user_id": owner.id,
+        "username": owner.username,
+        "orders": [
+            {
+                "id": order["pk"],
+                "delivery_address": order["delivery_address"],
+                "promocode": order["promocode"],
+                "created_at": datetime_field.to_representation(order["created_at"]),
+                "updated_at": datetime_field.to_representation(order["updated_at"]),
+                "total": total_field.to_representation(order["total"]),
+                "products_count": order["products_count"],
+                "receipt": default_storage.url(order["receipt"]) if order["receipt"] else None,
+                "user": order["user_id"],
+                "products": product_ids[order["pk"]],
+            }
+            for order in orders
+        ],
+    }
+
+
+def stream_json_list(key, items):
+    """
+    Кодирует ``{key: [items...]}`` по частям. Байты совпадают с тем,
+    что выдал бы JsonResponse для того же словаря.
+    """
+    encoder = DjangoJSONEncoder()
+    yield f'{{{encoder.encode(key)}: ['.encode()
+    for index, item in enumerate(items):
+        prefix = ", " if index else ""
+        yield (prefix + encoder.encode(item)).encode()
+    yield b"]}"
+
+
+def stream_ndjson(items):
+    encoder = DjangoJSONEncoder()
+    for item in items:
+        yield (encoder.encode(item) + "\n").encode()
+
+
+class CSVImportReport:
+    """
+    Итоги импорта: число строк, ошибки по строкам и скорость.
+    """
+    max_errors = 1000
+
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.failed = 0
+        self.batches = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        if not self.elapsed:
+            return 0.0
+        return self.rows / self.elapsed
+
+    def add_error(self, line: int, errors) -> None:
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "errors": errors})
+
+    def as_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "imported": self.imported,
+            "failed": self.failed,
+            "batches": self.batches,
+            "errors": self.errors,
+            "elapsed": round(self.elapsed, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+        }
+
+
+PRODUCT_UPSERT_FIELDS = ["name", "description", "price", "discount", "updated_at"]
+
+
+def _save_products_batch(batch, report: CSVImportReport) -> None:
+    # строки без sku вставляются как новые, для остальных - upsert по sku;
+    # повторы sku внутри пачки схлопываются, побеждает последняя строка
+    by_sku = {}
+    products = []
+    for product in batch:
+        if product.sku:
+            by_sku[product.sku] = product
+        else:
+            products.append(product)
+    products.extend(by_sku.values())
+
+    with transaction.atomic():
+        Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=["sku"],
+            update_fields=PRODUCT_UPSERT_FIELDS,
+        )
+    report.imported += len(products)
+    report.batches += 1
+
+
+def save_csv_products(file, encoding, batch_size=1000, on_batch=None) -> CSVImportReport:
+    """
+    Потоковый импорт товаров из CSV.
+
+    Файл читается построчно и сохраняется пачками по ``batch_size``,
+    каждая пачка в своей транзакции, поэтому память не растёт с размером
+    файла, а ошибка в одной строке не отменяет весь импорт.
+    ``on_batch(report)`` вызывается после каждой сохранённой пачки.
+    """
+    report = CSVImportReport()
+    started = default_timer()
     csv_file = TextIOWrapper(
         file,
         encoding=encoding,
     )
     reader = DictReader(csv_file)
 
-    products = [
-        Product(**row)
-        for row in reader
-    ]
-    Product.objects.bulk_create(products)
-    return products
+    batch = []
+    for row in reader:
+        report.rows += 1
+        form = ProductCSVRowForm(row)
+        if not form.is_valid():
+            report.add_error(reader.line_num, form.errors.get_json_data())
+            continue
+        data = form.cleaned_data
+        batch.append(Product(
+            sku=data["sku"] or None,
+            name=data["name"],
+            description=data["description"],
+            price=data["price"] if data["price"] is not None else 0,
+            discount=data["discount"] or 0,
+        ))
+        if len(batch) >= batch_size:
+            _save_products_batch(batch, report)
+            batch = []
+            if on_batch:
+                on_batch(report)
+
+    if batch:
+        _save_products_batch(batch, report)
+
+    csv_file.detach()
+    report.elapsed = default_timer() - started
+    return report
+
+
+def _save_orders_batch(batch, report: CSVImportReport, batch_size: int) -> None:
+    # строки с несуществующими товарами не импортируются, а попадают в ошибки
+    known = resolve_product_ids(pk for _, data in batch for pk in data["product_ids"])
+    orders_data = []
+    for line, data in batch:
+        unknown = [pk for pk in data["product_ids"] if pk not in known]
+        if unknown:
+            report.add_error(line, f"Unknown product ids: {', '.join(map(str, unknown))}")
+        else:
+            orders_data.append(data)
+    report.imported += len(bulk_create_orders(orders_data, batch_size=batch_size))
+    report.batches += 1
+
+
+def save_csv_orders(file, encoding, user, batch_size=500, on_batch=None) -> CSVImportReport:
+    """
+    Импорт заказов из CSV с колонками address, promocode, products
+    (id товаров через запятую). Заказы создаются от имени ``user``
+    пачками через :func:`shopapp.services.bulk_create_orders`.
+
+    Весь импорт идёт в одной транзакции: если сохранение упадёт, в БД не
+    останется части заказов. Поэтому прогресс из ``on_batch`` виден
+    другим соединениям только после завершения импорта.
+    """
+    report = CSVImportReport()
+    started = default_timer()
+    csv_file = TextIOWrapper(
+        file,
+        encoding=encoding,
+    )
+    reader = DictReader(csv_file)
+
+    with transaction.atomic():
+        batch = []
+        for row in reader:
+            report.rows += 1
+            try:
+                product_ids = [int(pk) for pk in (row["products"] or "").split(",") if pk.strip()]
+                promocode = row["promocode"]
+                if not promocode:
+                    raise ValueError("promocode is required")
+                batch.append((reader.line_num, {
+                    "user": user,
+                    "delivery_address": row["address"],
+                    "promocode": promocode,
+                    "product_ids": product_ids,
+                }))
+            except (KeyError, ValueError) as exc:
+                report.add_error(reader.line_num, str(exc))
+                continue
+            if len(batch) >= batch_size:
+                _save_orders_batch(batch, report, batch_size)
+                batch = []
+                if on_batch:
+                    on_batch(report)
+
+        if batch:
+            _save_orders_batch(batch, report, batch_size)
+
+    csv_file.detach()
+    report.elapsed = default_timer() - started
+    return report
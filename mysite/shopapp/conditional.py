@@ -0,0 +1,121 @@
+"""
+Условные GET-запросы (ETag / Last-Modified) для товаров и заказов.
+
+Отпечаток ресурса считается одним лёгким запросом (максимальное время
+изменения и число строк), поэтому ответ 304 отдаётся без сериализации
+и рендеринга шаблона.
+"""
+
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from .cache import normalize_query_params
+from .models import Product, Order
+
+
+def _fingerprint(request, compute):
+    # etag_func и last_modified_func вызываются для одного запроса,
+    # запоминаем результат, чтобы не делать запрос к БД дважды
+    if not hasattr(request, "_shop_fingerprint"):
+        request._shop_fingerprint = compute()
+    return request._shop_fingerprint
+
+
+def _make_etag(request, *parts):
+    parts = [
+        request.path,
+        normalize_query_params(request.GET),
+        getattr(request, "accepted_media_type", ""),
+        *map(str, parts),
+    ]
+    return hashlib.md5("|".join(parts).encode()).hexdigest()
+
+
+def products_list_fingerprint(request):
+    return _fingerprint(request, lambda: Product.objects.aggregate(
+        last_modified=Max("updated_at"),
+        count=Count("pk"),
+    ))
+
+
+def product_fingerprint(request, pk):
+    return _fingerprint(request, lambda: (
+        Product.objects
+        .filter(pk=pk, archived=False)
+        .annotate(images_count=Count("images"), images_modified=Max("images__updated_at"))
+        .values("updated_at", "images_count", "images_modified")
+        .first()
+    ))
+
+
+def order_fingerprint(request, pk):
+    return _fingerprint(request, lambda: (
+        Order.objects
+        .filter(pk=pk)
+        .annotate(products_modified=Max("products__updated_at"))
+        .values("updated_at", "products_modified", "products_count")
+        .first()
+    ))
+
+
+def products_list_etag(request, *args, **kwargs):
+    data = products_list_fingerprint(request)
+    return _make_etag(request, data["last_modified"], data["count"])
+
+
+def products_list_last_modified(request, *args, **kwargs):
+    return products_list_fingerprint(request)["last_modified"]
+
+
+def _product_last_modified(data):
+    # описание и миниатюры изображений меняются без сохранения товара
+    if data["images_modified"] is None:
+        return data["updated_at"]
+    return max(data["updated_at"], data["images_modified"])
+
+
+def product_etag(request, pk, *args, **kwargs):
+    data = product_fingerprint(request, pk)
+    if data is None:
+        return None
+    return _make_etag(request, _product_last_modified(data), data["images_count"])
+
+
+def product_last_modified(request, pk, *args, **kwargs):
+    data = product_fingerprint(request, pk)
+    return data and _product_last_modified(data)
+
+
+def _order_last_modified(data):
+    if data["products_modified"] is None:
+        return data["updated_at"]
+    return max(data["updated_at"], data["products_modified"])
+
+
+def order_etag(request, pk, *args, **kwargs):
+    data = order_fingerprint(request, pk)
+    if data is None:
+        return None
+    return _make_etag(request, _order_last_modified(data), data["products_count"])
+
+
+def order_last_modified(request, pk, *args, **kwargs):
+    data = order_fingerprint(request, pk)
+    return data and _order_last_modified(data)
+
+
+products_list_condition = method_decorator(condition(
+    etag_func=products_list_etag,
+    last_modified_func=products_list_last_modified,
+))
+product_condition = method_decorator(condition(
+    etag_func=product_etag,
+    last_modified_func=product_last_modified,
+))
+order_condition = method_decorator(condition(
+    etag_func=order_etag,
+    last_modified_func=order_last_modified,
+))
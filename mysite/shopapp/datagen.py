@@ -0,0 +1,213 @@
+"""
+Генерация синтетических данных магазина для нагрузочных проверок.
+
+Пользователи, товары, заказы и строки ``Order.products.through``
+создаются пачками через ``bulk_create``, каждая пачка в своей транзакции.
+Суммы заказов (``total``, ``products_count``) считаются сразу в Python,
+поэтому пересчёт через сигналы не нужен; поколения кэша пользователей
+и заказов увеличиваются после каждой пачки. При одинаковом ``seed`` данные
+получаются одинаковыми.
+"""
+
+import random
+import time
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .cache import bump_generation, invalidate_user_orders_export
+from .models import Order, Product
+
+OrderProduct = Order.products.through
+
+ADJECTIVES = (
+    "Compact", "Smart", "Wireless", "Portable", "Classic", "Pro", "Ultra",
+    "Eco", "Gaming", "Mini", "Premium", "Rugged", "Silent", "Digital",
+)
+NOUNS = (
+    "Laptop", "Desktop", "Smartphone", "Tablet", "Monitor", "Keyboard",
+    "Mouse", "Headphones", "Speaker", "Camera", "Router", "Printer",
+    "Charger", "Watch", "Drive", "Projector",
+)
+WORDS = (
+    "fast", "reliable", "battery", "screen", "quality", "warranty", "design",
+    "light", "durable", "performance", "storage", "wireless", "display",
+    "sound", "power", "compact", "premium", "everyday", "office", "travel",
+    "home", "ports", "memory", "processor", "resolution", "charging",
+)
+DISCOUNTS = (0, 5, 10, 15, 20, 30, 50)
+DISCOUNT_WEIGHTS = (60, 10, 10, 6, 7, 5, 2)
+PROMOCODES = ("NONE", "SALE", "WELCOME", "VIP10")
+PROMOCODE_WEIGHTS = (6, 2, 1, 1)
+MAX_PRICE = Decimal("999999.99")
+
+
+class ItemsDistribution:
+    """
+    Число товаров в заказе: ``uniform`` - равномерно от ``minimum`` до
+    ``maximum``, ``geometric`` - чаще маленькие заказы со средним ``mean``.
+    """
+
+    def __init__(self, kind="geometric", minimum=1, maximum=10, mean=3):
+        if kind not in ("uniform", "geometric"):
+            raise ValueError(f"Unknown distribution {kind!r}")
+        if not 1 <= minimum <= maximum:
+            raise ValueError("Expected 1 <= minimum <= maximum")
+        self.kind = kind
+        self.minimum = minimum
+        self.maximum = maximum
+        self.mean = max(mean, minimum)
+
+    def sample(self, rng: random.Random) -> int:
+        if self.kind == "uniform":
+            return rng.randint(self.minimum, self.maximum)
+        p = 1 / (self.mean - self.minimum + 1)
+        count = self.minimum
+        while count < self.maximum and rng.random() > p:
+            count += 1
+        return count
+
+
+def _batches(total: int, batch_size: int):
+    for start in range(0, total, batch_size):
+        yield start, min(batch_size, total - start)
+
+
+def _make_product(rng: random.Random, number: int) -> Product:
+    # цены с длинным хвостом: много недорогих товаров и немного дорогих
+    price = Decimal(str(round(rng.lognormvariate(3.5, 1.2), 2)))
+    return Product(
+        name=f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {number}",
+        description=" ".join(rng.choices(WORDS, k=rng.randint(5, 30))).capitalize(),
+        price=min(max(price, Decimal("0.99")), MAX_PRICE),
+        discount=rng.choices(DISCOUNTS, DISCOUNT_WEIGHTS)[0],
+    )
+
+
+def generate_users(count: int, rng: random.Random, batch_size=1000, prefix="shopper") -> int:
+    offset = User.objects.filter(username__startswith=prefix).count()
+    password = make_password(None)
+    for start, size in _batches(count, batch_size):
+        with transaction.atomic():
+            User.objects.bulk_create(
+                [
+                    User(
+                        username=f"{prefix}{offset + start + i}",
+                        email=f"{prefix}{offset + start + i}@example.com",
+                        password=password,
+                        first_name=rng.choice(("Ivan", "Anna", "Oleg", "Maria", "Petr", "Olga")),
+                    )
+                    for i in range(size)
+                ],
+                batch_size=batch_size,
+            )
+    # bulk_create не шлёт post_save, закэшированные фрагменты сбрасываются здесь
+    bump_generation("user")
+    return count
+
+
+def generate_products(count: int, rng: random.Random, batch_size=1000) -> int:
+    offset = Product.objects.count()
+    for start, size in _batches(count, batch_size):
+        with transaction.atomic():
+            Product.objects.bulk_create(
+                [_make_product(rng, offset + start + i) for i in range(size)],
+                batch_size=batch_size,
+            )
+    return count
+
+
+def _pick_products(rng: random.Random, ranks, cum_weights, count: int) -> list:
+    """
+    ``count`` разных товаров (не больше размера каталога). Повторы
+    перевыбираются, а не отбрасываются, иначе заказы выходят меньше
+    ``minimum`` распределения.
+    """
+    if count >= len(ranks):
+        return list(ranks)
+    picked = {}
+    while len(picked) < count:
+        for index in rng.choices(ranks, cum_weights=cum_weights, k=count - len(picked)):
+            picked[index] = None
+    return list(picked)
+
+
+def generate_orders(count: int, rng: random.Random, distribution: ItemsDistribution, batch_size=1000) -> int:
+    """
+    Создаёт заказы и их строки. Товары выбираются с перекосом популярности
+    (вес 1/ранг), как в реальном каталоге. Возвращает число заказов
+    вместе со строками.
+    """
+    user_ids = list(User.objects.values_list("pk", flat=True))
+    products = list(Product.objects.order_by("pk").values_list("pk", "price"))
+    if not user_ids or not products:
+        raise ValueError("Users and products are required to generate orders")
+    cum_weights = list(accumulate(1 / rank for rank in range(1, len(products) + 1)))
+    ranks = list(range(len(products)))
+    rng.shuffle(ranks)
+
+    links_total = 0
+    for start, size in _batches(count, batch_size):
+        orders = []
+        order_products = []
+        for i in range(size):
+            picked = _pick_products(rng, ranks, cum_weights, distribution.sample(rng))
+            items = [products[index] for index in picked]
+            orders.append(Order(
+                user_id=rng.choice(user_ids),
+                promocode=rng.choices(PROMOCODES, PROMOCODE_WEIGHTS)[0],
+                delivery_address=f"ul. {rng.choice(NOUNS)}, d. {rng.randint(1, 200)}",
+                total=sum((price for _, price in items), Decimal(0)),
+                products_count=len(items),
+            ))
+            order_products.append([pk for pk, _ in items])
+
+        with transaction.atomic():
+            Order.objects.bulk_create(orders, batch_size=batch_size)
+            links = [
+                OrderProduct(order_id=order.pk, product_id=product_pk)
+                for order, product_pks in zip(orders, order_products)
+                for product_pk in product_pks
+            ]
+            OrderProduct.objects.bulk_create(links, batch_size=batch_size)
+        invalidate_user_orders_export(*{order.user_id for order in orders})
+        bump_generation("order")
+        links_total += len(links)
+    return count + links_total
+
+
+def generate_shop_data(
+    users=0,
+    products=0,
+    orders=0,
+    distribution=None,
+    seed=42,
+    batch_size=1000,
+    on_stage=None,
+) -> dict:
+    """
+    Генерирует данные и возвращает статистику по этапам:
+    {этап: (строк, секунд)}. ``on_stage(этап, строк, секунд)`` вызывается
+    после каждого этапа.
+    """
+    rng = random.Random(seed)
+    distribution = distribution or ItemsDistribution()
+    stats = {}
+
+    def stage(name, run):
+        start = time.perf_counter()
+        rows = run()
+        stats[name] = (rows, time.perf_counter() - start)
+        if on_stage is not None:
+            on_stage(name, *stats[name])
+
+    if users:
+        stage("users", lambda: generate_users(users, rng, batch_size))
+    if products:
+        stage("products", lambda: generate_products(products, rng, batch_size))
+    if orders:
+        stage("orders", lambda: generate_orders(orders, rng, distribution, batch_size))
+    return stats
@@ -43,4 +43,15 @@ class OrderForm(ModelForm):
 
 
 class CSVImportForm(forms.Form):
-    csv_file =  forms.FileField()
\ No newline at end of file
+    csv_file =  forms.FileField()
+
+
+class ProductCSVRowForm(forms.Form):
+    """
+    Проверка и приведение типов одной строки CSV при импорте товаров.
+    """
+    sku = forms.CharField(max_length=64, required=False)
+    name = forms.CharField(max_length=100)
+    description = forms.CharField(required=False)
+    price = forms.DecimalField(max_digits=8, decimal_places=2, min_value=0, required=False)
+    discount = forms.IntegerField(min_value=0, max_value=100, required=False)
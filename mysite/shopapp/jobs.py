@@ -0,0 +1,133 @@
+"""
+Фоновый запуск импорта из CSV без внешнего брокера.
+
+Задачи хранятся в таблице :model:`shopapp.ImportJob` и выполняются
+локальным пулом потоков. При ``SHOP_IMPORT_JOBS_EAGER = True``
+(например, в тестах) задача выполняется сразу в текущем потоке.
+Задачи, оставшиеся в очереди после перезапуска, можно выполнить
+командой ``run_import_jobs``. Она же перезапускает задачи, застрявшие
+в статусе ``running`` после падения процесса: запись выполняющейся
+задачи обновляется после каждой пачки, и если она не менялась дольше
+``SHOP_IMPORT_JOB_STALE_SECONDS``, задача считается брошенной.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .common import save_csv_products, save_csv_orders
+from .models import ImportJob
+
+log = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, "SHOP_IMPORT_JOB_WORKERS", 2),
+            thread_name_prefix="shop-import",
+        )
+    return _executor
+
+
+def enqueue_import(kind: str, uploaded_file, encoding: str, user=None) -> ImportJob:
+    job = ImportJob(kind=kind, encoding=encoding or "utf-8")
+    if user is not None and user.is_authenticated:
+        job.user = user
+    if kind == ImportJob.KIND_ORDERS and job.user is None:
+        # заказы создаются от имени загрузившего пользователя
+        raise ValueError("Order imports require an authenticated user")
+    job.file.save(uploaded_file.name, uploaded_file, save=False)
+    job.save()
+
+    if getattr(settings, "SHOP_IMPORT_JOBS_EAGER", False):
+        run_import_job(job.pk)
+    else:
+        transaction.on_commit(lambda: get_executor().submit(run_job_in_thread, job.pk))
+    return job
+
+
+def run_job_in_thread(job_pk: int) -> None:
+    close_old_connections()
+    try:
+        run_import_job(job_pk)
+    finally:
+        close_old_connections()
+
+
+def runnable_jobs():
+    """Задачи в очереди и задачи, брошенные упавшим процессом."""
+    stale_before = timezone.now() - timedelta(
+        seconds=getattr(settings, "SHOP_IMPORT_JOB_STALE_SECONDS", 3600)
+    )
+    return ImportJob.objects.filter(
+        Q(status=ImportJob.STATUS_QUEUED)
+        | Q(status=ImportJob.STATUS_RUNNING, updated_at__lt=stale_before)
+    )
+
+
+def _save_progress(job: ImportJob, report) -> None:
+    job.rows = report.rows
+    job.imported = report.imported
+    job.failed = report.failed
+    job.errors = report.errors
+    job.save(update_fields=["rows", "imported", "failed", "errors", "updated_at"])
+
+
+def _fail(job: ImportJob, message: str) -> None:
+    job.status = ImportJob.STATUS_FAILED
+    job.message = message
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "message", "finished_at", "updated_at"])
+
+
+def run_import_job(job_pk: int) -> None:
+    now = timezone.now()
+    updated = runnable_jobs().filter(pk=job_pk).update(
+        status=ImportJob.STATUS_RUNNING,
+        started_at=now,
+        updated_at=now,
+    )
+    if not updated:
+        # задачу уже забрал другой поток или процесс
+        return
+
+    job = ImportJob.objects.get(pk=job_pk)
+    log.info("Running import job %s", job)
+    if job.kind == ImportJob.KIND_ORDERS and job.user_id is None:
+        # пользователь удалён, пока задача ждала в очереди
+        _fail(job, "Order imports require a user")
+        return
+    try:
+        with job.file.open("rb") as file:
+            if job.kind == ImportJob.KIND_PRODUCTS:
+                report = save_csv_products(
+                    file,
+                    encoding=job.encoding,
+                    on_batch=lambda report: _save_progress(job, report),
+                )
+            else:
+                report = save_csv_orders(
+                    file,
+                    encoding=job.encoding,
+                    user=job.user,
+                    on_batch=lambda report: _save_progress(job, report),
+                )
+    except Exception as exc:
+        log.exception("Import job %s failed", job)
+        _fail(job, str(exc))
+        return
+
+    _save_progress(job, report)
+    job.status = ImportJob.STATUS_DONE
+    job.message = f"{report.rows_per_second:.0f} rows/sec"
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "message", "finished_at", "updated_at"])
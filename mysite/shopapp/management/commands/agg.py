@@ -19,14 +19,13 @@ class Command(BaseCommand):
         # )
         # print(result)
 
-        orders = Order.objects.annotate(
-            total=Sum("products__price", default=0),
-            products_count=Count("products"),
-        )
+        # total и products_count хранятся в заказе и поддерживаются сигналами,
+        # см. shopapp.services.refresh_order_totals
+        orders = Order.objects.only("id", "total", "products_count")
         for order in orders:
             print(
                 f"Order #{order.id} "
                 f"with {order.products_count} "
                 f"products worth {order.total}"
             )
-        self.stdout.write("Done")
\ No newline at end of file
+        self.stdout.write("Done")
@@ -0,0 +1,102 @@
+import json
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import BaseCommand, CommandError
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from mysite.sitemaps import generate_sitemaps
+from shopapp.benchmark import compare_with_baseline, run_benchmark, seed_dataset
+
+# синтетические данные не должны попасть в кэш и метрики приложения
+BENCH_CACHES = {
+    "default": {
+        "BACKEND": "mysite.cache_backends.TwoTierCache",
+        "OPTIONS": {"SHARED_CACHE": "shared", "LOG_CACHE": "invalidation"},
+    },
+    "shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "bench-shared"},
+    "invalidation": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "bench-invalidation"},
+}
+
+
+class Command(BaseCommand):
+    """
+    Times key shop routes on a seeded test database and compares with a baseline
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=500)
+        parser.add_argument("--orders", type=int, default=200)
+        parser.add_argument("--articles", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument("--route", action="append", dest="routes")
+        parser.add_argument("--output", default="bench-results.json")
+        parser.add_argument("--baseline", default=settings.BENCH_BASELINE)
+        parser.add_argument("--threshold", type=float, default=0.5)
+        parser.add_argument("--min-delta-ms", type=float, default=2.0)
+        parser.add_argument("--update-baseline", action="store_true")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Run benchmark")
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(
+                SITEMAPS_ROOT=Path(tempfile.mkdtemp()),
+                CACHES=BENCH_CACHES,
+                METRICS_MULTIPROCESS_DIR=None,
+            ):
+                cache.clear()
+                context = seed_dataset(
+                    products=options["products"],
+                    orders=options["orders"],
+                    articles=options["articles"],
+                    seed=options["seed"],
+                )
+                generate_sitemaps()
+                results = run_benchmark(
+                    context,
+                    iterations=options["iterations"],
+                    warmup=options["warmup"],
+                    names=options["routes"],
+                )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<20} {result['status']} "
+                f"p50 {result['p50_ms']:>8.2f}ms  p95 {result['p95_ms']:>8.2f}ms  "
+                f"queries {result['queries']}"
+            )
+        Path(options["output"]).write_text(json.dumps(results, indent=2))
+
+        baseline_path = Path(options["baseline"])
+        if options["update_baseline"]:
+            baseline_path.write_text(json.dumps(results, indent=2))
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {baseline_path}"))
+            return
+        if not baseline_path.exists():
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+            return
+
+        regressions = compare_with_baseline(
+            results,
+            json.loads(baseline_path.read_text()),
+            threshold=options["threshold"],
+            min_delta_ms=options["min_delta_ms"],
+        )
+        if regressions:
+            raise CommandError("Regressions:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {baseline_path}"))
@@ -4,6 +4,7 @@ from django.contrib.auth.models import User
 from django.core.management import BaseCommand
 from django.db import transaction
 from shopapp.models import Order, Product
+from shopapp.services import add_products_to_orders
 
 
 class Command(BaseCommand):
@@ -12,13 +13,11 @@ class Command(BaseCommand):
         self.stdout.write("Create order with products")
         user = User.objects.get(username="admin")
         # products: Sequence[Product] = Product.objects.defer("description", "price", "created_at").all()
-        products: Sequence[Product] = Product.objects.only("id").all()
+        product_ids: Sequence[int] = Product.objects.values_list("pk", flat=True)
         order, created = Order.objects.get_or_create(
             delivery_address="ul Ivanova, d 8",
             promocode="promo5",
             user=user,
         )
-        for product in products:
-            order.products.add(product)
-        order.save()
-        self.stdout.write("Created order {order}")
\ No newline at end of file
+        add_products_to_orders({order.pk: list(product_ids)})
+        self.stdout.write(f"Created order {order}")
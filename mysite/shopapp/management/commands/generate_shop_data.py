@@ -0,0 +1,52 @@
+from django.core.management import BaseCommand, CommandError
+
+from shopapp.datagen import ItemsDistribution, generate_shop_data
+
+
+class Command(BaseCommand):
+    """
+    Generates synthetic users, products and orders in batches
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--orders", type=int, default=1000)
+        parser.add_argument("--items-distribution", choices=("geometric", "uniform"), default="geometric")
+        parser.add_argument("--items-min", type=int, default=1)
+        parser.add_argument("--items-max", type=int, default=10)
+        parser.add_argument("--items-mean", type=float, default=3)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def on_stage(self, name, rows, seconds):
+        self.stdout.write(
+            f"{name}: {rows} rows in {seconds:.1f}s ({rows / max(seconds, 1e-9):,.0f} rows/sec)"
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Generate shop data")
+        try:
+            distribution = ItemsDistribution(
+                kind=options["items_distribution"],
+                minimum=options["items_min"],
+                maximum=options["items_max"],
+                mean=options["items_mean"],
+            )
+            stats = generate_shop_data(
+                users=options["users"],
+                products=options["products"],
+                orders=options["orders"],
+                distribution=distribution,
+                seed=options["seed"],
+                batch_size=options["batch_size"],
+                on_stage=self.on_stage,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        rows = sum(rows for rows, _ in stats.values())
+        seconds = sum(seconds for _, seconds in stats.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {rows} rows in {seconds:.1f}s ({rows / max(seconds, 1e-9):,.0f} rows/sec)"
+        ))
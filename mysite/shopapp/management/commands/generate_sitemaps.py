@@ -0,0 +1,17 @@
+from django.core.management import BaseCommand
+
+from mysite.sitemaps import generate_sitemaps
+
+
+class Command(BaseCommand):
+    """
+    Writes sitemap index and sitemap pages to SITEMAPS_ROOT
+    """
+
+    def handle(self, *args, **options):
+        self.stdout.write("Generate sitemaps")
+        stats = generate_sitemaps()
+        self.stdout.write(self.style.SUCCESS(
+            f"Sitemap pages: {stats['pages']}, "
+            f"written {stats['written']}, unchanged {stats['skipped']}"
+        ))
@@ -0,0 +1,57 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+
+from shopapp.models import Product, ProductImage
+from shopapp.thumbnails import generate_derivatives, get_thumbnails, get_widths, save_thumbnails
+
+
+class Command(BaseCommand):
+    """
+    Generates missing thumbnails for existing product previews and images
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Regenerate existing thumbnails")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Generate product thumbnails")
+        pending = [
+            (instance, field_name)
+            for queryset, field_name in (
+                (Product.objects.exclude(preview="").exclude(preview=None), "preview"),
+                (ProductImage.objects.exclude(image=""), "image"),
+            )
+            for instance in queryset.iterator()
+            if options["force"] or get_thumbnails(getattr(instance, field_name)) is None
+        ]
+        pending = [
+            (instance, field_name)
+            for instance, field_name in pending
+            if default_storage.exists(getattr(instance, field_name).name)
+        ]
+        widths = tuple(get_widths())
+
+        workers = getattr(settings, "SHOP_THUMBNAIL_WORKERS", 2)
+        failed = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                (instance, field_name, executor.submit(
+                    generate_derivatives,
+                    default_storage.path(getattr(instance, field_name).name),
+                    widths,
+                ))
+                for instance, field_name in pending
+            ]
+            for instance, field_name, future in futures:
+                try:
+                    save_thumbnails(instance, field_name, future.result())
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f"{getattr(instance, field_name).name}: {exc}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {len(pending) - failed} images, {failed} failed"
+        ))
@@ -0,0 +1,17 @@
+from django.core.management import BaseCommand, CommandError
+
+from shopapp.search import fts_available, rebuild_index
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds full-text search index for products
+    """
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            raise CommandError("Full-text search index is not available for this database")
+
+        self.stdout.write("Rebuild products search index")
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} products"))
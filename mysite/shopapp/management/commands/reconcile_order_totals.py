@@ -0,0 +1,50 @@
+from django.core.management import BaseCommand
+
+from shopapp.cache import invalidate_user_orders_export
+from shopapp.models import Order
+from shopapp.services import order_totals_expressions
+
+
+class Command(BaseCommand):
+    """
+    Recomputes stored order totals and fixes drifted rows in batches
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        self.stdout.write("Reconcile order totals")
+        expressions = order_totals_expressions()
+
+        last_pk = 0
+        checked = fixed = 0
+        while True:
+            orders = list(
+                Order.objects
+                .filter(pk__gt=last_pk)
+                .order_by("pk")
+                .annotate(
+                    actual_total=expressions["total"],
+                    actual_count=expressions["products_count"],
+                )
+                .only("pk", "user_id", "total", "products_count")[:batch_size]
+            )
+            if not orders:
+                break
+            last_pk = orders[-1].pk
+            checked += len(orders)
+
+            drifted = []
+            for order in orders:
+                if order.total != order.actual_total or order.products_count != order.actual_count:
+                    order.total = order.actual_total
+                    order.products_count = order.actual_count
+                    drifted.append(order)
+            if drifted:
+                Order.objects.bulk_update(drifted, ["total", "products_count"])
+                invalidate_user_orders_export(*{order.user_id for order in drifted})
+                fixed += len(drifted)
+
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} orders, fixed {fixed}"))
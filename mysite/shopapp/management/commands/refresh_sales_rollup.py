@@ -0,0 +1,21 @@
+from django.core.management import BaseCommand
+
+from shopapp.reports import refresh_sales_rollup
+
+
+class Command(BaseCommand):
+    """
+    Refreshes daily product sales rollups from new orders
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Rebuild rollups from scratch instead of incremental refresh",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Refresh sales rollups")
+        count = refresh_sales_rollup(full=options["full"])
+        self.stdout.write(self.style.SUCCESS(f"Updated {count} rollup rows"))
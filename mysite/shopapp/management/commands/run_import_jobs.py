@@ -0,0 +1,20 @@
+from django.core.management import BaseCommand
+
+from shopapp.jobs import run_import_job, runnable_jobs
+from shopapp.models import ImportJob
+
+
+class Command(BaseCommand):
+    """
+    Runs queued import jobs and restarts stale running ones in the current process
+    """
+
+    def handle(self, *args, **options):
+        self.stdout.write("Run queued import jobs")
+        job_pks = list(runnable_jobs().order_by("pk").values_list("pk", flat=True))
+        for job_pk in job_pks:
+            run_import_job(job_pk)
+            job = ImportJob.objects.get(pk=job_pk)
+            self.stdout.write(f"Job #{job.pk}: {job.status}, {job.imported} imported, {job.failed} failed")
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {len(job_pks)} jobs"))
@@ -1,6 +1,7 @@
 from django.core.management import BaseCommand
 
 from shopapp.models import Order, Product
+from shopapp.services import add_products_to_orders
 
 
 class Command(BaseCommand):
@@ -10,15 +11,11 @@ class Command(BaseCommand):
             self.stdout.write("no order found")
             return
 
-        products = Product.objects.all()
-
-        for product in products:
-            order.products.add(product)
-
-        order.save()
+        product_ids = Product.objects.values_list("pk", flat=True)
+        add_products_to_orders({order.pk: list(product_ids)})
 
         self.stdout.write(
             self.style.SUCCESS(
                 f"Successfully added products {order.products.all()} to order {order}"
             )
-        )
\ No newline at end of file
+        )
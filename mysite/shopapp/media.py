@@ -0,0 +1,133 @@
+"""
+Отдача защищённых файлов (чеки заказов, изображения товаров).
+
+Права проверяются в представлении, а сами байты либо отдаются через
+Python с поддержкой Range и условных запросов, либо передаются веб-серверу
+заголовком ``X-Accel-Redirect`` (nginx) или ``X-Sendfile`` (apache),
+см. настройки ``SHOP_SENDFILE_BACKEND`` и ``SHOP_SENDFILE_PREFIX``.
+
+Ссылки на изображения товаров в шаблонах строит :func:`product_image_url`,
+уменьшенные копии (см. :mod:`shopapp.thumbnails`) отдаются теми же
+представлениями с параметрами ``w`` и ``fmt``.
+"""
+
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, quote_etag, urlencode
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+# поле с изображением -> представление, которое его отдаёт
+PRODUCT_IMAGE_URLS = {
+    "preview": "shopapp:product_preview",
+    "image": "shopapp:product_image",
+}
+
+
+def product_image_url(file, width=None, fmt=None) -> str:
+    """Ссылка на ``Product.preview`` или ``ProductImage.image`` (или их копию)."""
+    url = reverse(PRODUCT_IMAGE_URLS[file.field.name], kwargs={"pk": file.instance.pk})
+    if width is not None:
+        url += "?" + urlencode({"w": width, "fmt": fmt})
+    return url
+
+
+def parse_range(header: str, size: int):
+    """
+    Разбирает заголовок Range с одним диапазоном. Возвращает (start, end)
+    включительно, None - если заголовок не поддерживается (отдаём весь
+    файл), или ValueError - если диапазон не выполним.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # последние N байт
+        length = int(end)
+        if length == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = int(end) if end else size - 1
+    if start >= size or end < start:
+        raise ValueError("Unsatisfiable range")
+    return start, min(end, size - 1)
+
+
+def _iter_range(file, start: int, length: int):
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_protected_file(request, name: str, as_attachment=False):
+    if not name or not default_storage.exists(name):
+        raise Http404("File not found")
+
+    path = default_storage.path(name)
+    stat = os.stat(path)
+    etag = quote_etag(f"{int(stat.st_mtime)}-{stat.st_size}")
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    backend = getattr(settings, "SHOP_SENDFILE_BACKEND", None)
+
+    if backend:
+        response = HttpResponse(content_type=content_type)
+        if backend == "nginx":
+            prefix = getattr(settings, "SHOP_SENDFILE_PREFIX", "/protected-media/")
+            response["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + name
+        else:
+            response["X-Sendfile"] = path
+    else:
+        byte_range = None
+        range_header = request.headers.get("Range")
+        if_range = request.headers.get("If-Range")
+        if range_header and (not if_range or if_range == etag):
+            try:
+                byte_range = parse_range(range_header, stat.st_size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{stat.st_size}"
+                return response
+
+        if byte_range is None:
+            response = FileResponse(open(path, "rb"), content_type=content_type)
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                _iter_range(open(path, "rb"), start, length),
+                status=206,
+                content_type=content_type,
+            )
+            response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+            response["Content-Length"] = str(length)
+        response["Accept-Ranges"] = "bytes"
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = "private"
+    if as_attachment:
+        response["Content-Disposition"] = content_disposition_header(True, os.path.basename(name))
+    return response
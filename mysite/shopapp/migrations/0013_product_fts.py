@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS shopapp_product_fts "
+        "USING fts5(name, description)"
+    )
+    schema_editor.execute(
+        "INSERT INTO shopapp_product_fts (rowid, name, description) "
+        "SELECT id, name, description FROM shopapp_product"
+    )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS shopapp_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0012_alter_order_options_alter_product_options_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.6 on 2026-10-18 03:16
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_order_totals(apps, schema_editor):
+    Order = apps.get_model("shopapp", "Order")
+    OrderProduct = Order.products.through
+    links = (
+        OrderProduct.objects
+        .filter(order_id=OuterRef("pk"))
+        .values("order_id")
+    )
+    Order.objects.update(
+        total=Coalesce(
+            Subquery(links.annotate(s=Sum("product__price")).values("s")),
+            Value(0),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        ),
+        products_count=Coalesce(
+            Subquery(links.annotate(c=Count("pk")).values("c")),
+            Value(0),
+            output_field=IntegerField(),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0016_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='products_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(fill_order_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.6 on 2026-10-18 03:53
+
+from django.db import migrations, models
+
+
+def reset_sales_rollup(apps, schema_editor):
+    # сводка по дням пуста: сбрасываем отметку, следующий запуск пересчитает обе
+    apps.get_model("shopapp", "DailyProductSales").objects.all().delete()
+    apps.get_model("shopapp", "RollupState").objects.filter(name="daily_product_sales").delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0018_dailyproductsales_rollupstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'Daily sales',
+                'verbose_name_plural': 'Daily sales',
+            },
+        ),
+        migrations.RunPython(reset_sales_rollup, migrations.RunPython.noop),
+    ]
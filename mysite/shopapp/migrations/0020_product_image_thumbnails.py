@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 04:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0019_dailysales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='preview_thumbnails',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='image_thumbnails',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
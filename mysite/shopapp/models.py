@@ -1,5 +1,7 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.dispatch import Signal
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.urls import reverse
 
@@ -10,6 +12,32 @@ def product_preview_directory_path(instance: "Product", filename: str) -> str:
         filename=filename,
     )
 
+# Отправляется при массовых изменениях товаров (bulk_create, update),
+# для которых Django не вызывает post_save. Аргумент pks - список pk,
+# fields - изменённые поля (None, если неизвестно).
+products_changed = Signal()
+
+# Отправляется, когда строки Order.products.through меняются без m2m_changed:
+# сервисом массового создания заказов (shopapp.services) и при сохранении
+# строк напрямую (инлайны админки).
+orders_changed = Signal()
+
+
+class ProductQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        pks = [obj.pk for obj in objs if obj.pk is not None]
+        products_changed.send(sender=self.model, pks=pks, fields=None)
+        return objs
+
+    def update(self, **kwargs):
+        kwargs.setdefault("updated_at", timezone.now())
+        pks = list(self.values_list("pk", flat=True))
+        rows = super().update(**kwargs)
+        products_changed.send(sender=self.model, pks=pks, fields=list(kwargs))
+        return rows
+
+
 class Product(models.Model):
     """
     Модель Product представляет товар,
@@ -22,20 +50,37 @@ class Product(models.Model):
         verbose_name = _("Product")
         verbose_name_plural = _('Products')
 
+    sku = models.CharField(max_length=64, null=True, blank=True, unique=True)
     name = models.CharField(max_length=100, db_index=True)
     description = models.TextField(null=False, blank=True, db_index=True)
     price = models.DecimalField(default=0, max_digits=8, decimal_places=2)
     discount = models.SmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     archived = models.BooleanField(default=False)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     preview = models.ImageField(null=True, blank=True, upload_to=product_preview_directory_path)
+    # созданные копии preview: {"name": ..., "widths": [...]}, см. shopapp.thumbnails
+    preview_thumbnails = models.JSONField(null=True, blank=True, editable=False)
+
+    objects = ProductQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # цена из БД: суммы заказов пересчитываются, только если она изменилась
+        instance._loaded_price = instance.__dict__.get("price")
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_price = self.__dict__.get("price")
 
     def __str__(self) -> str:
         return f"Product(pk={self.pk}, name{self.name!r})"
 
     def get_absolute_url(self):
-        return reverse("shopapp:product", kwargs={"pk": self.pk})
+        return reverse("shopapp:product_details", kwargs={"pk": self.pk})
 
 
 def product_images_directory_path(instance: "ProductImage", filename: str) -> str:
@@ -47,7 +92,9 @@ def product_images_directory_path(instance: "ProductImage", filename: str) -> st
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="images")
     image = models.ImageField(upload_to=product_images_directory_path)
+    image_thumbnails = models.JSONField(null=True, blank=True, editable=False)
     description = models.CharField(max_length=200, null=False, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
 
 class Order(models.Model):
@@ -57,6 +104,114 @@ class Order(models.Model):
     delivery_address = models.TextField(null=True, blank=True)
     promocode = models.CharField(max_length=20, null=False, blank=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    total = models.DecimalField(default=0, max_digits=10, decimal_places=2, db_index=True)
+    products_count = models.PositiveIntegerField(default=0, db_index=True)
     user = models.ForeignKey(User, on_delete=models.PROTECT)
     products = models.ManyToManyField(Product, related_name="orders")
-    receipt = models.FileField(null=True, upload_to='orders/receipts/')
\ No newline at end of file
+    receipt = models.FileField(null=True, upload_to='orders/receipts/')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # владелец из БД: при смене владельца сбрасывается и его выгрузка
+        instance._loaded_user_id = instance.__dict__.get("user_id")
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_user_id = self.__dict__.get("user_id")
+
+
+class ImportJob(models.Model):
+    """
+    Фоновая задача импорта товаров или заказов из CSV.
+
+    Файл сохраняется на диск, задача выполняется пулом потоков
+    из :mod:`shopapp.jobs`, а прогресс пишется в эту же запись.
+    """
+    KIND_PRODUCTS = "products"
+    KIND_ORDERS = "orders"
+    KIND_CHOICES = [
+        (KIND_PRODUCTS, _("Products")),
+        (KIND_ORDERS, _("Orders")),
+    ]
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, _("Queued")),
+        (STATUS_RUNNING, _("Running")),
+        (STATUS_DONE, _("Done")),
+        (STATUS_FAILED, _("Failed")),
+    ]
+
+    class Meta:
+        ordering = ["-pk"]
+        verbose_name = _("Import job")
+        verbose_name_plural = _("Import jobs")
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    file = models.FileField(upload_to="imports/")
+    encoding = models.CharField(max_length=40, default="utf-8")
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    rows = models.PositiveIntegerField(default=0)
+    imported = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # обновляется с каждой пачкой, по нему находятся брошенные задачи
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"ImportJob(pk={self.pk}, kind={self.kind!r}, status={self.status!r})"
+
+
+class DailyProductSales(models.Model):
+    """
+    Сводка продаж товара за день: число заказов, единиц и выручка.
+    Пересчитывается по дням, см. :mod:`shopapp.reports`.
+    """
+    class Meta:
+        verbose_name = _("Daily product sales")
+        verbose_name_plural = _("Daily product sales")
+        constraints = [
+            models.UniqueConstraint(fields=["day", "product"], name="unique_daily_product_sales"),
+        ]
+
+    day = models.DateField(db_index=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="daily_sales")
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(default=0, max_digits=14, decimal_places=2)
+
+
+class DailySales(models.Model):
+    """
+    Сводка продаж за день по всем товарам. Заказ с несколькими товарами
+    считается один раз, поэтому ``orders`` не выводится из
+    :model:`shopapp.DailyProductSales`.
+    """
+    class Meta:
+        verbose_name = _("Daily sales")
+        verbose_name_plural = _("Daily sales")
+
+    day = models.DateField(unique=True)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(default=0, max_digits=14, decimal_places=2)
+
+
+class RollupState(models.Model):
+    """
+    Отметка, до которой (по Order.created_at) уже посчитаны сводки.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    high_water_mark = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
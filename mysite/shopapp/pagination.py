@@ -0,0 +1,184 @@
+"""
+Пагинация для API интернет-магазина.
+
+По умолчанию используется обычная постраничная пагинация.
+Клиент может включить keyset-пагинацию (по курсору), передав
+``?pagination=cursor`` или ``?cursor=...``: тогда страницы выбираются
+по паре (поле сортировки, pk) без COUNT(*) и OFFSET.
+"""
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset-пагинация по стабильному ключу (поле сортировки, pk).
+
+    Поле сортировки берётся из ``OrderingFilter`` (только поля модели из
+    ``ordering_fields`` представления), pk добавляется для однозначности.
+    Если выборка упорядочена по аннотации (например, ``search_rank``
+    полнотекстового поиска), страницы идут по pk.
+    """
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def __init__(self, page_size):
+        self.page_size = page_size
+
+    def get_ordering(self, request, queryset, view):
+        ordering = OrderingFilter().get_ordering(request, queryset, view)
+        if not ordering:
+            ordering = queryset.query.order_by or queryset.model._meta.ordering
+        field = ordering[0] if ordering else "pk"
+        if not isinstance(field, str):
+            return "pk", False
+        descending = field.startswith("-")
+        field = field.lstrip("-")
+        if field in ("id", "pk"):
+            return "pk", descending
+        if not self.is_model_field(queryset.model, field, view):
+            return "pk", False
+        return field, descending
+
+    def is_model_field(self, model, field, view):
+        valid_fields = getattr(view, "ordering_fields", None)
+        if valid_fields not in (None, "__all__") and field not in valid_fields:
+            return False
+        try:
+            model._meta.get_field(field)
+        except FieldDoesNotExist:
+            return False
+        return True
+
+    def encode_cursor(self, value, pk, reverse):
+        data = json.dumps({"v": value, "pk": pk, "r": int(reverse)})
+        return urlsafe_b64encode(data.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(urlsafe_b64decode(encoded.encode()))
+            value, pk, reverse = data["v"], int(data["pk"]), bool(data["r"])
+            if self.field != "pk":
+                value = self.model._meta.get_field(self.field).to_python(value)
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None and self.field != "pk":
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk, reverse
+
+    def get_key(self, obj):
+        if self.field == "pk":
+            value = obj.pk
+        else:
+            attname = self.model._meta.get_field(self.field).attname
+            value = getattr(obj, attname)
+        if not isinstance(value, (int, str)) and value is not None:
+            value = str(value)
+        return value, obj.pk
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.model = queryset.model
+        self.field, self.descending = self.get_ordering(request, queryset, view)
+
+        cursor = self.decode_cursor(request)
+        reverse = cursor[2] if cursor else False
+        # при движении назад обходим выборку в обратном порядке
+        descending = self.descending != reverse
+
+        prefix = "-" if descending else ""
+        if self.field == "pk":
+            queryset = queryset.order_by(f"{prefix}pk")
+        else:
+            queryset = queryset.order_by(f"{prefix}{self.field}", f"{prefix}pk")
+
+        if cursor is not None:
+            value, pk, _ = cursor
+            lookup = "lt" if descending else "gt"
+            if self.field == "pk":
+                queryset = queryset.filter(**{f"pk__{lookup}": pk})
+            else:
+                queryset = queryset.filter(
+                    Q(**{f"{self.field}__{lookup}": value})
+                    | Q(**{self.field: value, f"pk__{lookup}": pk})
+                )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.has_next = has_more if not reverse else True
+        self.has_previous = cursor is not None if not reverse else has_more
+        self.page = results
+        return results
+
+    def get_link(self, obj, reverse):
+        url = self.request.build_absolute_uri()
+        value, pk = self.get_key(obj)
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            self.encode_cursor(value, pk, reverse),
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.get_link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.get_link(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("next", self.get_next_link()),
+            ("previous", self.get_previous_link()),
+            ("results", data),
+        ]))
+
+
+class ShopPagination(PageNumberPagination):
+    """
+    Постраничная пагинация с опциональным переключением на keyset.
+    """
+    pagination_query_param = "pagination"
+
+    def use_keyset(self, request):
+        return (
+            request.query_params.get(self.pagination_query_param) == "cursor"
+            or KeysetPagination.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.use_keyset(request):
+            page_size = self.get_page_size(request)
+            if not page_size:
+                return None
+            self.keyset = KeysetPagination(page_size)
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
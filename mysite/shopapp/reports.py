@@ -0,0 +1,112 @@
+"""
+Сводки продаж по дням и товарам.
+
+Сводные таблицы :model:`shopapp.DailyProductSales` (по товарам) и
+:model:`shopapp.DailySales` (по дням) обновляются по дням: каждый запуск
+заново считает последние ``SHOP_ROLLUP_WINDOW_DAYS`` дней (туда попадают
+заказы из транзакций, зафиксированных позже их ``created_at``, например
+импорт из CSV) и дни заказов, изменённых (``Order.updated_at``) после
+прошлого запуска. Отчёты читают только сводки.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import DailyProductSales, DailySales, Order, RollupState
+
+ROLLUP_NAME = "daily_product_sales"
+
+
+def _collect_sales(days, *keys):
+    links = Order.products.through.objects.all()
+    if days is not None:
+        links = links.filter(order__created_at__date__in=days)
+    return (
+        links
+        .values(*keys, day=F("order__created_at__date"))
+        .annotate(
+            orders=Count("order_id", distinct=True),
+            units=Count("pk"),
+            revenue=Sum("product__price"),
+        )
+        .order_by()
+    )
+
+
+def _replace_rollup(model, rows, days) -> int:
+    """Заменяет строки сводки ``model`` за дни ``days`` (все, если None) на ``rows``."""
+    stale = model.objects.all() if days is None else model.objects.filter(day__in=days)
+    stale.delete()
+    created = model.objects.bulk_create(
+        [
+            model(**{**row, "revenue": row["revenue"] or 0})
+            for row in rows
+        ],
+        batch_size=500,
+    )
+    return len(created)
+
+
+def _days_to_refresh(since, until) -> set:
+    window = getattr(settings, "SHOP_ROLLUP_WINDOW_DAYS", 2)
+    today = timezone.localdate(until)
+    days = {today - timedelta(days=offset) for offset in range(window + 1)}
+    if since is not None:
+        # правки старых заказов: состав, цены (пересчёт сумм обновляет updated_at)
+        days.update(
+            Order.objects
+            .filter(updated_at__gt=since - timedelta(days=window))
+            .dates("created_at", "day")
+        )
+    return days
+
+
+@transaction.atomic
+def refresh_sales_rollup(full=False, now=None) -> int:
+    """
+    Пересчитывает сводки за последние дни и за дни изменённых заказов.
+    ``full=True`` (и первый запуск) пересчитывает сводки с нуля.
+    Возвращает число строк сводок.
+
+    Отметка запуска отстаёт от текущего времени на ``SHOP_ROLLUP_LAG``
+    секунд, чтобы не пропустить изменения из ещё не завершённых транзакций.
+    """
+    lag = getattr(settings, "SHOP_ROLLUP_LAG", 60)
+    until = (now or timezone.now()) - timedelta(seconds=lag)
+    state, _ = RollupState.objects.select_for_update().get_or_create(name=ROLLUP_NAME)
+
+    since = None if full else state.high_water_mark
+    days = None if since is None else _days_to_refresh(since, until)
+    count = _replace_rollup(DailyProductSales, _collect_sales(days, "product_id"), days)
+    count += _replace_rollup(DailySales, _collect_sales(days), days)
+
+    state.high_water_mark = until
+    state.save()
+    return count
+
+
+def daily_sales(start, end):
+    return list(
+        DailySales.objects
+        .filter(day__range=(start, end))
+        .values("day", "orders", "units", "revenue")
+        .order_by("day")
+    )
+
+
+def top_products(start, end, limit=10):
+    return list(
+        DailyProductSales.objects
+        .filter(day__range=(start, end))
+        .values("product_id", "product__name")
+        .annotate(
+            orders=Sum("orders"),
+            units=Sum("units"),
+            revenue=Sum("revenue"),
+        )
+        .order_by("-revenue", "product_id")[:limit]
+    )
@@ -0,0 +1,121 @@
+"""
+Полнотекстовый поиск товаров на SQLite FTS5.
+
+Индекс хранится в виртуальной таблице ``shopapp_product_fts``
+(rowid = pk товара) и обновляется сигналами из :mod:`shopapp.signals`.
+На других СУБД, или если таблицы нет, используется обычный поиск LIKE.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+from .models import Product
+
+FTS_TABLE = "shopapp_product_fts"
+
+# {имя БД: есть ли таблица}, сбрасывается после migrate
+_fts_available = {}
+
+
+def fts_available() -> bool:
+    if connection.vendor != "sqlite":
+        return False
+    name = connection.settings_dict["NAME"]
+    if name not in _fts_available:
+        _fts_available[name] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_available[name]
+
+
+def reset_fts_available() -> None:
+    _fts_available.clear()
+
+
+def build_match_query(term: str) -> str:
+    """
+    Превращает пользовательский ввод в безопасный запрос MATCH:
+    каждое слово берётся в кавычки и ищется по префиксу.
+    """
+    words = re.findall(r"\w+", term)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def index_products(pks) -> None:
+    pks = list(pks)
+    if not pks or not fts_available():
+        return
+    placeholders = ", ".join(["%s"] * len(pks))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})",
+            pks,
+        )
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description) "
+            f"SELECT id, name, description FROM shopapp_product "
+            f"WHERE id IN ({placeholders})",
+            pks,
+        )
+
+
+def unindex_products(pks) -> None:
+    pks = list(pks)
+    if not pks or not fts_available():
+        return
+    placeholders = ", ".join(["%s"] * len(pks))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})",
+            pks,
+        )
+
+
+def rebuild_index() -> int:
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description) "
+            f"SELECT id, name, description FROM shopapp_product"
+        )
+        return cursor.rowcount
+
+
+def search_products(queryset, term: str):
+    """
+    Фильтрует queryset товаров по индексу и сортирует по релевантности.
+    Возвращает None, если полнотекстовый поиск недоступен.
+    """
+    match = build_match_query(term)
+    if not match or not fts_available():
+        return None
+    matched = RawSQL(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+        (match,),
+    )
+    rank = RawSQL(
+        f"SELECT bm25({FTS_TABLE}) FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND rowid = shopapp_product.id",
+        (match,),
+    )
+    return (
+        queryset
+        .filter(pk__in=matched)
+        .annotate(search_rank=rank)
+        .order_by("search_rank", "pk")
+    )
+
+
+class ProductFullTextSearchFilter(SearchFilter):
+    """
+    SearchFilter для товаров, использующий FTS5 вместо LIKE '%term%'.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        term = " ".join(self.get_search_terms(request))
+        if term and queryset.model is Product:
+            result = search_products(queryset, term)
+            if result is not None:
+                return result
+        return super().filter_queryset(request, queryset, view)
@@ -1,12 +1,13 @@
 from rest_framework import serializers
 
-from .models import Product, Order
+from .models import Product, Order, ImportJob
 
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = (
             "pk",
+            "sku",
             "name",
             "description",
             "price",
@@ -28,4 +29,28 @@ class OrderSerializer(serializers.ModelSerializer):
             "user",
             "products",
             "receipt",
-        ]
\ No newline at end of file
+            "total",
+            "products_count",
+        ]
+        read_only_fields = [
+            "total",
+            "products_count",
+        ]
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = [
+            "pk",
+            "kind",
+            "status",
+            "rows",
+            "imported",
+            "failed",
+            "errors",
+            "message",
+            "created_at",
+            "started_at",
+            "finished_at",
+        ]
@@ -0,0 +1,120 @@
+"""
+Массовое создание заказов и привязка товаров к ним.
+
+Вместо ``Order.objects.create`` и ``order.products.set`` на каждую строку
+все id товаров проверяются одним запросом, а заказы и строки таблицы
+``Order.products.through`` создаются пачками через ``bulk_create``
+в одной транзакции.
+"""
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache import invalidate_user_orders_export_on_commit
+from .models import Order, Product, orders_changed
+
+OrderProduct = Order.products.through
+
+
+def resolve_product_ids(product_ids) -> set:
+    """Возвращает только существующие id товаров, одним запросом."""
+    product_ids = set(product_ids)
+    if not product_ids:
+        return set()
+    return set(
+        Product.objects
+        .filter(pk__in=product_ids)
+        .values_list("pk", flat=True)
+    )
+
+
+def add_products_to_orders(order_products, batch_size=1000) -> int:
+    """
+    Привязывает товары к заказам: ``order_products`` - словарь
+    {pk заказа: список pk товаров}. Уже привязанные и несуществующие товары
+    пропускаются; чтобы сообщить о несуществующих, проверьте id заранее
+    через :func:`resolve_product_ids`.
+    """
+    existing = resolve_product_ids(
+        pk for product_ids in order_products.values() for pk in product_ids
+    )
+    links = [
+        OrderProduct(order_id=order_pk, product_id=product_pk)
+        for order_pk, product_ids in order_products.items()
+        for product_pk in dict.fromkeys(product_ids)
+        if product_pk in existing
+    ]
+    with transaction.atomic():
+        OrderProduct.objects.bulk_create(links, batch_size=batch_size, ignore_conflicts=True)
+        orders_changed.send(sender=Order, pks=list(order_products))
+    return len(links)
+
+
+def bulk_create_orders(orders_data, batch_size=500) -> list:
+    """
+    Создаёт заказы пачками. ``orders_data`` - последовательность словарей
+    с полями заказа и ключом ``product_ids``.
+    """
+    orders_data = list(orders_data)
+    with transaction.atomic():
+        orders = Order.objects.bulk_create(
+            [
+                Order(**{key: value for key, value in data.items() if key != "product_ids"})
+                for data in orders_data
+            ],
+            batch_size=batch_size,
+        )
+        add_products_to_orders(
+            {
+                order.pk: data.get("product_ids", [])
+                for order, data in zip(orders, orders_data)
+            },
+            batch_size=batch_size,
+        )
+    return orders
+
+
+def order_totals_expressions() -> dict:
+    """Выражения для пересчёта Order.total и Order.products_count."""
+    links = (
+        OrderProduct.objects
+        .filter(order_id=OuterRef("pk"))
+        .values("order_id")
+    )
+    return {
+        "total": Coalesce(
+            Subquery(links.annotate(s=Sum("product__price")).values("s")),
+            Value(0),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        ),
+        "products_count": Coalesce(
+            Subquery(links.annotate(c=Count("pk")).values("c")),
+            Value(0),
+            output_field=IntegerField(),
+        ),
+    }
+
+
+def refresh_order_totals(order_pks=None, product_pks=None) -> int:
+    """
+    Пересчитывает сохранённые суммы заказов одним UPDATE:
+    для заказов из ``order_pks`` и/или заказов с товарами из ``product_pks``.
+    Выгрузки заказов затронутых пользователей сбрасываются: в них есть ``total``.
+    """
+    orders = Order.objects.none()
+    if order_pks:
+        orders = orders | Order.objects.filter(pk__in=list(order_pks))
+    if product_pks:
+        orders = orders | Order.objects.filter(
+            pk__in=OrderProduct.objects
+            .filter(product_id__in=list(product_pks))
+            .values("order_id")
+        )
+    user_ids = set(orders.values_list("user_id", flat=True))
+    # updated_at: сводки продаж пересчитывают дни изменённых заказов
+    rows = orders.update(updated_at=timezone.now(), **order_totals_expressions())
+    if user_ids:
+        invalidate_user_orders_export_on_commit(*user_ids)
+    return rows
@@ -0,0 +1,172 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed, post_migrate
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import bump_generation_on_commit, invalidate_user_orders_export_on_commit
+from .models import Product, Order, ProductImage, products_changed, orders_changed
+from .search import index_products, reset_fts_available, unindex_products
+from .services import refresh_order_totals
+from .thumbnails import schedule_thumbnails
+
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance: Product, **kwargs):
+    index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance: Product, **kwargs):
+    unindex_products([instance.pk])
+
+
+@receiver(products_changed, sender=Product)
+def index_changed_products(sender, pks, **kwargs):
+    index_products(pks)
+
+
+@receiver(post_migrate)
+def forget_fts_available(sender, **kwargs):
+    # таблицу поиска создаёт миграция
+    reset_fts_available()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(products_changed, sender=Product)
+def bump_product_generation(sender, **kwargs):
+    bump_generation_on_commit("product")
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(orders_changed, sender=Order)
+def bump_order_generation(sender, **kwargs):
+    bump_generation_on_commit("order")
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def bump_order_generation_on_products_change(sender, action, **kwargs):
+    if action.startswith("post_"):
+        bump_generation_on_commit("order")
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_user_generation(sender, update_fields=None, **kwargs):
+    # вход пользователя сохраняет только last_login, фрагменты от него не зависят
+    if update_fields is not None and set(update_fields) == {"last_login"}:
+        return
+    bump_generation_on_commit("user")
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def remember_cleared_orders(sender, instance, action, reverse, **kwargs):
+    if action == "pre_clear" and reverse:
+        instance._cleared_order_pks = list(instance.orders.values_list("pk", flat=True))
+
+
+def _changed_order_pks(instance, reverse, pk_set) -> list:
+    if not reverse:
+        return [instance.pk]
+    if pk_set is not None:
+        # изменение со стороны товара: product.orders.add(...)
+        return list(pk_set)
+    # product.orders.clear(): в post_clear связи уже удалены
+    return getattr(instance, "_cleared_order_pks", [])
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def touch_order_on_products_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    order_pks = _changed_order_pks(instance, reverse, pk_set)
+    if order_pks:
+        Order.objects.filter(pk__in=order_pks).update(updated_at=timezone.now())
+
+
+@receiver(orders_changed, sender=Order)
+def touch_changed_orders(sender, pks, **kwargs):
+    if pks:
+        Order.objects.filter(pk__in=pks).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_order_user_export(sender, instance: Order, **kwargs):
+    user_ids = {instance.user_id}
+    loaded_user_id = getattr(instance, "_loaded_user_id", None)
+    if loaded_user_id is not None:
+        user_ids.add(loaded_user_id)
+    instance._loaded_user_id = instance.user_id
+    invalidate_user_orders_export_on_commit(*user_ids)
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def invalidate_export_on_products_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        invalidate_user_orders_export_on_commit(instance.user_id)
+        return
+    order_pks = _changed_order_pks(instance, reverse, pk_set)
+    if order_pks:
+        user_ids = Order.objects.filter(pk__in=order_pks).values_list("user_id", flat=True).distinct()
+        invalidate_user_orders_export_on_commit(*user_ids)
+
+
+@receiver(orders_changed, sender=Order)
+def invalidate_changed_orders_export(sender, pks, **kwargs):
+    if pks:
+        user_ids = Order.objects.filter(pk__in=pks).values_list("user_id", flat=True).distinct()
+        invalidate_user_orders_export_on_commit(*user_ids)
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def refresh_totals_on_products_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action.startswith("post_"):
+        refresh_order_totals(order_pks=_changed_order_pks(instance, reverse, pk_set))
+
+
+@receiver(orders_changed, sender=Order)
+def refresh_changed_orders_totals(sender, pks, **kwargs):
+    refresh_order_totals(order_pks=pks)
+
+
+@receiver(post_save, sender=Product)
+def refresh_totals_on_product_save(sender, instance: Product, created, update_fields=None, **kwargs):
+    if update_fields is not None and "price" not in update_fields:
+        return
+    loaded_price = getattr(instance, "_loaded_price", None)
+    instance._loaded_price = instance.price
+    if created or (loaded_price is not None and loaded_price == instance.price):
+        return
+    refresh_order_totals(product_pks=[instance.pk])
+
+
+@receiver(products_changed, sender=Product)
+def refresh_totals_on_products_changed(sender, pks, fields=None, **kwargs):
+    if fields is None or "price" in fields:
+        refresh_order_totals(product_pks=pks)
+
+
+@receiver(pre_delete, sender=Product)
+def remember_product_orders(sender, instance: Product, **kwargs):
+    instance._order_pks = list(instance.orders.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Product)
+def refresh_totals_on_product_delete(sender, instance: Product, **kwargs):
+    refresh_order_totals(order_pks=getattr(instance, "_order_pks", []))
+
+
+@receiver(post_save, sender=Product)
+def make_preview_thumbnails(sender, instance: Product, raw=False, **kwargs):
+    if not raw:
+        schedule_thumbnails(instance, "preview")
+
+
+@receiver(post_save, sender=ProductImage)
+def make_image_thumbnails(sender, instance: ProductImage, raw=False, **kwargs):
+    if not raw:
+        schedule_thumbnails(instance, "image")
@@ -4,9 +4,15 @@ from .models import Product
 class ShopSitemap(Sitemap):
     changefreq = "weekly"
     priority = 0.8
+    limit = 5000
 
     def items(self):
-        return Product.objects.all()
+        return (
+            Product.objects
+            .filter(archived=False)
+            .only("pk", "updated_at")
+            .order_by("pk")
+        )
 
     def lastmod(self, obj: Product):
-        return obj.created_at
\ No newline at end of file
+        return obj.updated_at
@@ -0,0 +1,57 @@
+from django import template
+from django.templatetags.cache import CacheNode
+from django.utils import translation
+
+from shopapp.cache import get_generation
+
+register = template.Library()
+
+
+class GenerationsVar:
+    """Псевдо-переменная для ключа фрагмента: язык и поколения моделей."""
+
+    def __init__(self, names):
+        self.names = names
+
+    def resolve(self, context):
+        generations = ".".join(str(get_generation(name)) for name in self.names)
+        return f"{translation.get_language()}:{generations}"
+
+
+@register.tag("generation_cache")
+def do_generation_cache(parser, token):
+    """
+    Как ``{% cache %}``, но ключ дополнительно включает текущий язык
+    и поколения моделей из ``depends``. Любое изменение этих моделей
+    меняет ключ, поэтому фрагменты можно кэшировать надолго::
+
+        {% load generation_cache %}
+        {% generation_cache 86400 order_list owner.pk page_obj.number depends="order,product" %}
+            ...
+        {% endgeneration_cache %}
+    """
+    nodelist = parser.parse(("endgeneration_cache",))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError("%r tag requires at least 2 arguments." % tokens[0])
+
+    cache_name = None
+    depends = []
+    options = tokens[3:]
+    while options and ("=" in options[-1]):
+        name, _, value = options.pop().partition("=")
+        if name == "using":
+            cache_name = parser.compile_filter(value)
+        elif name == "depends":
+            depends = [part for part in value.strip("\"'").split(",") if part]
+        else:
+            raise template.TemplateSyntaxError("Unknown option %r for %r tag." % (name, tokens[0]))
+
+    return CacheNode(
+        nodelist,
+        parser.compile_filter(tokens[1]),
+        tokens[2],
+        [GenerationsVar(depends), *(parser.compile_filter(option) for option in options)],
+        cache_name,
+    )
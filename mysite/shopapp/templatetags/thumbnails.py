@@ -0,0 +1,28 @@
+from django import template
+from django.utils.html import format_html
+
+from shopapp.media import product_image_url
+from shopapp.thumbnails import srcset
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, alt="", sizes="(max-width: 640px) 100vw, 640px"):
+    """
+    <picture> с WebP/JPEG копиями из srcset и оригиналом как запасным src.
+    """
+    if not image:
+        return ""
+    url = product_image_url(image)
+    webp = srcset(image, "webp")
+    jpeg = srcset(image, "jpeg")
+    if not webp:
+        return format_html('<img src="{}" alt="{}">', url, alt)
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy">'
+        '</picture>',
+        webp, sizes, url, jpeg, sizes, alt,
+    )
@@ -1,12 +1,60 @@
+import gzip
+import json
+import multiprocessing
+import threading
+import pstats
+import tempfile
+import time
+from base64 import urlsafe_b64encode
+from pathlib import Path
+import tracemalloc
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
 from string import ascii_letters
+from unittest import mock
 from random import choices
 
 from django.conf import settings
-from django.contrib.auth.models import User, Permission
-from django.test import TestCase
+from django.core.cache import cache, caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.contrib.auth.models import AnonymousUser, User, Permission
+from django.db import connection
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone, translation
+from PIL import Image
+from rest_framework.serializers import ModelSerializer
 
-from shopapp.models import Product, Order
+from shopapp.admin import mark_archived
+from shopapp.cache import (
+    GENERATION_KEY,
+    bump_generation,
+    get_generation,
+    get_or_compute,
+    user_orders_export_key,
+)
+from shopapp.benchmark import compare_with_baseline, run_benchmark, seed_dataset
+from shopapp.common import save_csv_products, save_csv_orders
+from shopapp.datagen import ItemsDistribution, generate_shop_data
+from shopapp.jobs import enqueue_import
+from shopapp.models import Product, Order, ImportJob, DailyProductSales, DailySales, ProductImage
+from shopapp.reports import refresh_sales_rollup
+from shopapp.services import bulk_create_orders, refresh_order_totals
+from mysite.cache_backends import LockedFileBasedCache, TwoTierCache
+from mysite.db_routers import _state as _routing_state
+from mysite.metrics import MetricsMiddleware, MetricsRegistry, registry
+from mysite.profiling import make_profile_token
+from mysite.sitemaps import generate_sitemaps
+from blogapp.models import Article
+from blogapp.sitemap import BlogSitemap
+from shopapp import thumbnails
+from shopapp.search import fts_available, reset_fts_available, search_products
+from shopapp.views import ProductViewSet
 from shopapp.utils import add_two_numbers
 
 
@@ -188,3 +236,1447 @@ class OrdersExportTestCase(TestCase):
             for order in Order.objects.select_related("user").prefetch_related("products").all()
         ]
         self.assertEquals(response.json()["orders"], expected_data)
+
+
+class ProductsCSVStreamingExportTestCase(TestCase):
+    def setUp(self) -> None:
+        with translation.override("en"):
+            self.url = reverse("shopapp:product-download-csv")
+
+    def create_products(self, count):
+        Product.objects.bulk_create(
+            Product(name=f"Product {i}", description="x" * 100, price=i)
+            for i in range(count)
+        )
+
+    def measure_export_peak(self):
+        response = self.client.get(self.url, {"stream": "1"})
+        tracemalloc.start()
+        rows = 0
+        for chunk in response.streaming_content:
+            rows += chunk.count(b"\n")
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return rows, peak
+
+    def test_stream_keeps_filters(self):
+        self.create_products(5)
+        Product.objects.create(name="Special", description="unique")
+        response = self.client.get(self.url, {"stream": "1", "search": "unique"})
+        content = b"".join(response.streaming_content).decode()
+        self.assertEqual(
+            content.splitlines(),
+            ["name,description,price,discount", "Special,unique,0.00,0"],
+        )
+
+    def test_stream_memory_is_flat(self):
+        self.create_products(4000)
+        rows_small, peak_small = self.measure_export_peak()
+        self.create_products(16000)
+        rows_large, peak_large = self.measure_export_peak()
+
+        self.assertEqual(rows_small, 4001)
+        self.assertEqual(rows_large, 20001)
+        self.assertLess(peak_large, peak_small * 2)
+
+
+class ProductViewSetKeysetPaginationTestCase(TestCase):
+    def setUp(self) -> None:
+        with translation.override("en"):
+            self.url = reverse("shopapp:product-list")
+        Product.objects.bulk_create(
+            Product(name=f"Product {i:02}", price=i % 4)
+            for i in range(25)
+        )
+
+    def collect_pages(self, params):
+        pks = []
+        response = self.client.get(self.url, params)
+        while True:
+            data = response.json()
+            pks.extend(item["pk"] for item in data["results"])
+            if not data["next"]:
+                return pks, data
+            response = self.client.get(data["next"])
+
+    def test_page_number_is_default(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()["count"], 25)
+
+    def test_cursor_walks_all_rows_in_order(self):
+        pks, last_page = self.collect_pages({"pagination": "cursor", "ordering": "-price"})
+        expected = list(
+            Product.objects.order_by("-price", "-pk").values_list("pk", flat=True)
+        )
+        self.assertEqual(pks, expected)
+        self.assertNotIn("count", last_page)
+
+    def test_cursor_previous_link(self):
+        first = self.client.get(self.url, {"pagination": "cursor", "ordering": "price"}).json()
+        second = self.client.get(first["next"]).json()
+        back = self.client.get(second["previous"]).json()
+        self.assertEqual(back["results"], first["results"])
+
+    def test_cursor_with_search_pages_by_pk(self):
+        pks, _ = self.collect_pages({"pagination": "cursor", "search": "product"})
+        self.assertEqual(pks, sorted(Product.objects.values_list("pk", flat=True)))
+
+    def test_cursor_value_of_wrong_type(self):
+        cursor = urlsafe_b64encode(json.dumps({"v": "abc", "pk": 1, "r": 0}).encode()).decode()
+        response = self.client.get(self.url, {"cursor": cursor, "ordering": "price"})
+        self.assertEqual(response.status_code, 404)
+
+
+class ProductFullTextSearchTestCase(TestCase):
+    def setUp(self) -> None:
+        with translation.override("en"):
+            self.url = reverse("shopapp:product-list")
+
+    def search(self, term):
+        return list(
+            search_products(Product.objects.all(), term).values_list("name", flat=True)
+        )
+
+    def test_index_follows_save_update_and_delete(self):
+        product = Product.objects.create(name="Laptop", description="light notebook")
+        self.assertEqual(self.search("notebook"), ["Laptop"])
+
+        Product.objects.filter(pk=product.pk).update(description="gaming machine")
+        self.assertEqual(self.search("notebook"), [])
+        self.assertEqual(self.search("gam"), ["Laptop"])
+
+        product.delete()
+        self.assertEqual(self.search("gaming"), [])
+
+    def test_index_follows_bulk_create(self):
+        Product.objects.bulk_create([
+            Product(name="Phone", description="smart phone"),
+            Product(name="Desktop", description="tower"),
+        ])
+        self.assertEqual(self.search("smart"), ["Phone"])
+
+    def test_api_search_ranks_by_relevance(self):
+        Product.objects.create(name="Cable", description="phone cable")
+        Product.objects.create(name="Phone", description="phone phone phone")
+        response = self.client.get(self.url, {"search": "phone"})
+        names = [item["name"] for item in response.json()["results"]]
+        self.assertEqual(names, ["Phone", "Cable"])
+
+    def test_rebuild_command(self):
+        Product.objects.create(name="Tablet", description="")
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM shopapp_product_fts")
+        self.assertEqual(self.search("tablet"), [])
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(self.search("tablet"), ["Tablet"])
+
+    def test_missing_table_is_cached(self):
+        reset_fts_available()
+        try:
+            with mock.patch.object(connection.introspection, "table_names", return_value=[]) as table_names:
+                self.assertFalse(fts_available())
+                self.assertFalse(fts_available())
+            table_names.assert_called_once()
+        finally:
+            reset_fts_available()
+        self.assertTrue(fts_available())
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+})
+class ProductViewSetListCacheTestCase(TestCase):
+    def setUp(self) -> None:
+        with translation.override("en"):
+            self.url = reverse("shopapp:product-list")
+        self.product = Product.objects.create(name="Laptop", price=10)
+
+    def tearDown(self) -> None:
+        cache.clear()
+
+    def test_list_is_cached_per_query(self):
+        self.client.get(self.url, {"ordering": "price", "search": ""})
+        with self.assertNumQueries(1):  # только отпечаток для ETag
+            response = self.client.get(self.url, {"ordering": "price"})
+        self.assertEqual(response.json()["count"], 1)
+        with self.assertNumQueries(3):
+            self.client.get(self.url, {"ordering": "-price"})
+
+    def test_save_invalidates_list(self):
+        self.client.get(self.url)
+        self.product.name = "Notebook"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()["results"][0]["name"], "Notebook")
+
+    def test_admin_archive_invalidates_list(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_archived(None, None, Product.objects.all())
+        response = self.client.get(self.url)
+        self.assertTrue(response.json()["results"][0]["archived"])
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+})
+class GenerationCountersTestCase(TestCase):
+    def tearDown(self) -> None:
+        cache.clear()
+
+    def test_evicted_counter_does_not_repeat(self):
+        seen = [get_generation("product")]
+        bump_generation("product")
+        bump_generation("product")
+        seen.append(get_generation("product"))
+        cache.delete(GENERATION_KEY.format(name="product"))  # вытеснен или потерян
+        self.assertNotIn(get_generation("product"), seen)
+
+    def test_bump_of_missing_counter_does_not_repeat(self):
+        seen = [get_generation("order")]
+        cache.clear()
+        bump_generation("order")
+        self.assertNotIn(get_generation("order"), seen)
+
+    def test_generation_changes_after_commit(self):
+        before = get_generation("product")
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name="Laptop", price=10)
+            # до фиксации запросы ещё видят старые данные и старое поколение
+            self.assertEqual(get_generation("product"), before)
+        self.assertNotEqual(get_generation("product"), before)
+
+    def test_login_keeps_user_generation(self):
+        user = User.objects.create_user(username="bob_test", password="qwerty")
+        before = get_generation("user")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.login(username="bob_test", password="qwerty")
+        self.assertEqual(get_generation("user"), before)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.first_name = "Bob"
+            user.save()
+        self.assertNotEqual(get_generation("user"), before)
+
+    def test_stale_list_is_not_served_after_eviction(self):
+        with translation.override("en"):
+            url = reverse("shopapp:product-list")
+        product = Product.objects.create(name="Laptop", price=10)
+        self.client.get(url)
+        product.name = "Notebook"
+        product.save()
+        cache.delete(GENERATION_KEY.format(name="product"))
+        self.assertEqual(self.client.get(url).json()["results"][0]["name"], "Notebook")
+
+
+class ConditionalGetTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="bob_test", password="qwerty")
+        cls.user.user_permissions.add(Permission.objects.get(codename="view_order"))
+        cls.product = Product.objects.create(name="Laptop", price=10)
+        cls.order = Order.objects.create(user=cls.user, promocode="TEST")
+
+    def setUp(self) -> None:
+        self.client.force_login(self.user)
+        with translation.override("en"):
+            self.product_url = reverse("shopapp:product_details", kwargs={"pk": self.product.pk})
+            self.order_url = reverse("shopapp:order_details", kwargs={"pk": self.order.pk})
+            self.list_url = reverse("shopapp:product-list")
+
+    def assertNotModified(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        cached = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b"")
+        self.assertFalse(cached.templates)
+        return response["ETag"]
+
+    def test_product_details_not_modified(self):
+        etag = self.assertNotModified(self.product_url)
+        self.product.price = 20
+        self.product.save()
+        response = self.client.get(self.product_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_product_details_changes_with_images(self):
+        image = ProductImage.objects.create(product=self.product, image="products/laptop.png")
+        etag = self.assertNotModified(self.product_url)
+        image.description = "Side view"
+        image.save()
+        response = self.client.get(self.product_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response["ETag"]
+        thumbnails.save_thumbnails(image, "image", [160])
+        response = self.client.get(self.product_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_order_details_changes_with_products(self):
+        etag = self.assertNotModified(self.order_url)
+        self.order.products.add(self.product)
+        response = self.client.get(self.order_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_products_api_list_not_modified(self):
+        etag = self.assertNotModified(self.list_url)
+        Product.objects.create(name="Phone")
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class SaveCSVProductsTestCase(TestCase):
+    def import_csv(self, content, **kwargs):
+        return save_csv_products(BytesIO(content.encode()), encoding="utf-8", **kwargs)
+
+    def test_import_validates_rows(self):
+        report = self.import_csv(
+            "sku,name,description,price,discount\n"
+            "A1,Laptop,light,1999.00,5\n"
+            "A2,,no name,10,0\n"
+            "A3,Phone,,not a price,0\n"
+            ",Cable,,5,\n",
+            batch_size=2,
+        )
+        self.assertEqual(report.rows, 4)
+        self.assertEqual(report.imported, 2)
+        self.assertEqual(report.failed, 2)
+        self.assertEqual([error["line"] for error in report.errors], [3, 4])
+        self.assertIn("name", report.errors[0]["errors"])
+        self.assertEqual(Product.objects.get(name="Cable").sku, None)
+
+    def test_import_upserts_by_sku(self):
+        Product.objects.create(sku="A1", name="Old laptop", price=1)
+        report = self.import_csv(
+            "sku,name,price\n"
+            "A1,Laptop,100\n"
+            "A2,Phone,50\n"
+            "A1,Laptop Pro,150\n"
+        )
+        self.assertEqual(report.failed, 0)
+        self.assertEqual(Product.objects.count(), 2)
+        laptop = Product.objects.get(sku="A1")
+        self.assertEqual((laptop.name, laptop.price), ("Laptop Pro", 150))
+        self.assertGreater(report.rows_per_second, 0)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), SHOP_IMPORT_JOBS_EAGER=True)
+class ImportJobTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username="bob_test", password="qwerty")
+        self.client.force_login(self.user)
+        with translation.override("en"):
+            self.upload_url = reverse("shopapp:product-upload-csv")
+
+    def test_upload_csv_returns_job(self):
+        csv_file = SimpleUploadedFile("products.csv", b"name,price\nLaptop,10\n,5\n")
+        response = self.client.post(self.upload_url, {"file": csv_file})
+        self.assertEqual(response.status_code, 202)
+
+        job = ImportJob.objects.get(pk=response.json()["job"])
+        self.assertEqual(job.user, self.user)
+        status = self.client.get(response.json()["status_url"]).json()
+        self.assertEqual(status["status"], ImportJob.STATUS_DONE)
+        self.assertEqual((status["rows"], status["imported"], status["failed"]), (2, 1, 1))
+        self.assertTrue(Product.objects.filter(name="Laptop").exists())
+
+    def test_jobs_are_queued_until_commit(self):
+        with self.settings(SHOP_IMPORT_JOBS_EAGER=False):
+            with self.captureOnCommitCallbacks() as callbacks:
+                csv_file = SimpleUploadedFile("products.csv", b"name\nLaptop\n")
+                response = self.client.post(self.upload_url, {"file": csv_file})
+        self.assertEqual(len(callbacks), 1)
+        job = ImportJob.objects.get(pk=response.json()["job"])
+        self.assertEqual(job.status, ImportJob.STATUS_QUEUED)
+
+        call_command("run_import_jobs", stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_DONE)
+
+    def test_stale_running_jobs_are_restarted(self):
+        with self.settings(SHOP_IMPORT_JOBS_EAGER=False):
+            stale = enqueue_import(ImportJob.KIND_PRODUCTS, SimpleUploadedFile("a.csv", b"name\nLaptop\n"), "utf-8")
+            active = enqueue_import(ImportJob.KIND_PRODUCTS, SimpleUploadedFile("b.csv", b"name\nPhone\n"), "utf-8")
+        ImportJob.objects.update(status=ImportJob.STATUS_RUNNING)
+        ImportJob.objects.filter(pk=stale.pk).update(updated_at=datetime(2025, 3, 1, 12, tzinfo=dt_timezone.utc))
+
+        call_command("run_import_jobs", stdout=StringIO())
+        stale.refresh_from_db()
+        active.refresh_from_db()
+        self.assertEqual(stale.status, ImportJob.STATUS_DONE)
+        self.assertEqual(active.status, ImportJob.STATUS_RUNNING)
+
+    def test_order_import_requires_user(self):
+        csv_file = SimpleUploadedFile("orders.csv", b"address,promocode,products\n")
+        with self.assertRaises(ValueError):
+            enqueue_import(ImportJob.KIND_ORDERS, csv_file, "utf-8", user=AnonymousUser())
+        self.assertFalse(ImportJob.objects.exists())
+
+        with self.settings(SHOP_IMPORT_JOBS_EAGER=False):
+            job = enqueue_import(ImportJob.KIND_ORDERS, csv_file, "utf-8", user=self.user)
+        self.user.delete()
+        call_command("run_import_jobs", stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_FAILED)
+
+
+class SaveCSVOrdersTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username="bob_test", password="qwerty")
+        self.products = Product.objects.bulk_create(
+            Product(name=f"Product {i}") for i in range(5)
+        )
+
+    def import_orders(self, count, extra_pks=""):
+        pks = ",".join(str(product.pk) for product in self.products[:3]) + extra_pks
+        lines = ["address,promocode,products"]
+        lines.extend(f"Street {i},SALE,\"{pks}\"" for i in range(count))
+        content = BytesIO("\n".join(lines).encode())
+        with CaptureQueriesContext(connection) as queries:
+            report = save_csv_orders(content, encoding="utf-8", user=self.user)
+        return report, len(queries)
+
+    def test_import_links_existing_products(self):
+        report, _ = self.import_orders(2)
+        self.assertEqual(report.imported, 2)
+        order = Order.objects.order_by("pk").first()
+        self.assertEqual(
+            sorted(order.products.values_list("pk", flat=True)),
+            [product.pk for product in self.products[:3]],
+        )
+
+    def test_unknown_products_are_reported(self):
+        report, _ = self.import_orders(2, extra_pks=",999")
+        self.assertEqual((report.imported, report.failed), (0, 2))
+        self.assertEqual(report.errors[0], {"line": 2, "errors": "Unknown product ids: 999"})
+        self.assertFalse(Order.objects.exists())
+
+    def test_failure_rolls_back_whole_import(self):
+        lines = ["address,promocode,products"]
+        lines.extend(f"Street {i},SALE,{self.products[0].pk}" for i in range(3))
+        content = BytesIO("\n".join(lines).encode())
+
+        def fail_second_batch(orders_data, batch_size):
+            if Order.objects.exists():
+                raise RuntimeError("disk full")
+            return bulk_create_orders(orders_data, batch_size=batch_size)
+
+        with mock.patch("shopapp.common.bulk_create_orders", fail_second_batch):
+            with self.assertRaises(RuntimeError):
+                save_csv_orders(content, encoding="utf-8", user=self.user, batch_size=2)
+        self.assertFalse(Order.objects.exists())
+
+    def test_query_count_does_not_grow_with_rows(self):
+        # benchmark: число запросов не зависит от числа строк в файле
+        _, small = self.import_orders(10)
+        _, large = self.import_orders(100)
+        self.assertEqual(small, large)
+        self.assertEqual(Order.objects.count(), 110)
+
+
+class OrdersStreamingExportTestCase(TestCase):
+    fixtures = [
+        'orders-fixtures.json',
+    ]
+
+    def setUp(self) -> None:
+        self.client.force_login(User.objects.get(username="admin"))
+        with translation.override("en"):
+            self.url = reverse("shopapp:orders-export")
+
+    def test_stream_matches_json_response(self):
+        expected = self.client.get(self.url).content
+        response = self.client.get(self.url, {"stream": "1"})
+        self.assertTrue(response.streaming)
+        self.assertEqual(b"".join(response.streaming_content), expected)
+
+    def test_ndjson(self):
+        response = self.client.get(self.url, {"format": "ndjson"})
+        lines = b"".join(response.streaming_content).splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            self.client.get(self.url).json()["orders"],
+        )
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+})
+class ProductsExportCacheTestCase(TestCase):
+    def setUp(self) -> None:
+        with translation.override("en"):
+            self.url = reverse("shopapp:products-export")
+
+    def tearDown(self) -> None:
+        cache.clear()
+
+    def test_empty_catalog(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.json(), {"products": []})
+
+    def test_gzip_and_invalidation(self):
+        product = Product.objects.create(name="Laptop", price=10)
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(
+            json.loads(gzip.decompress(response.content)),
+            {"products": [{"pk": product.pk, "name": "Laptop", "price": "10.00", "archived": False}]},
+        )
+
+        product.name = "Notebook"
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip;q=0")
+        self.assertNotIn("Content-Encoding", response)
+        self.assertEqual(response.json()["products"][0]["name"], "Notebook")
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+})
+class ExportUserOrdersTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username="bob_test", password="qwerty")
+        self.products = [
+            Product.objects.create(name=name, price=1)
+            for name in ("Phone", "Cable", "Laptop")
+        ]
+        self.order = Order.objects.create(user=self.user, promocode="SALE")
+        self.order.products.set(self.products)
+        with translation.override("en"):
+            self.url = reverse("shopapp:export_user_orders", kwargs={"user_id": self.user.pk})
+
+    def tearDown(self) -> None:
+        cache.clear()
+
+    def test_payload_matches_model_serializer(self):
+        class OrderSerializer(ModelSerializer):
+            class Meta:
+                model = Order
+                fields = "__all__"
+
+        with self.assertNumQueries(3):  # пользователь, заказы, товары заказов
+            data = self.client.get(self.url).json()
+        expected = OrderSerializer(Order.objects.filter(user=self.user), many=True).data
+        self.assertEqual(data["orders"], json.loads(json.dumps(expected)))
+
+    def test_changes_invalidate_export(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.products.remove(self.products[0])
+        data = self.client.get(self.url).json()
+        self.assertEqual(len(data["orders"][0]["products"]), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(user=self.user, promocode="NEW")
+        data = self.client.get(self.url).json()
+        self.assertEqual(len(data["orders"]), 2)
+
+    def test_export_is_purged_after_commit(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.products.remove(self.products[0])
+            # пока импорт или правка не зафиксированы, выгрузка остаётся прежней
+            self.assertIsNotNone(cache.get(user_orders_export_key(self.user.pk)))
+        self.assertIsNone(cache.get(user_orders_export_key(self.user.pk)))
+
+    def test_reassigned_order_purges_both_users(self):
+        other = User.objects.create_user(username="alice_test", password="qwerty")
+        with translation.override("en"):
+            other_url = reverse("shopapp:export_user_orders", kwargs={"user_id": other.pk})
+        self.client.get(self.url)
+        self.client.get(other_url)
+        order = Order.objects.get(pk=self.order.pk)
+        order.user = other
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+        self.assertEqual(self.client.get(self.url).json()["orders"], [])
+        self.assertEqual(len(self.client.get(other_url).json()["orders"]), 1)
+
+    def test_reverse_clear_touches_orders(self):
+        old = datetime(2025, 3, 1, 12, tzinfo=dt_timezone.utc)
+        Order.objects.filter(pk=self.order.pk).update(updated_at=old)
+        self.products[0].orders.clear()
+        self.order.refresh_from_db()
+        self.assertGreater(self.order.updated_at, old)
+
+    def test_reverse_clear_invalidates_export(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].orders.clear()
+        data = self.client.get(self.url).json()
+        self.assertEqual(len(data["orders"][0]["products"]), 2)
+
+
+class OrderTotalsTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username="bob_test", password="qwerty")
+        self.laptop = Product.objects.create(name="Laptop", price="100.00")
+        self.phone = Product.objects.create(name="Phone", price="50.00")
+        self.order = Order.objects.create(user=self.user, promocode="SALE")
+
+    def assertTotals(self, total, count):
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.total, self.order.products_count), (Decimal(total), count))
+
+    def test_totals_follow_products_and_prices(self):
+        self.order.products.add(self.laptop, self.phone)
+        self.assertTotals("150.00", 2)
+
+        self.phone.price = "70.00"
+        self.phone.save()
+        self.assertTotals("170.00", 2)
+
+        Product.objects.filter(pk=self.laptop.pk).update(price="10.00")
+        self.assertTotals("80.00", 2)
+
+        self.laptop.orders.remove(self.order)
+        self.assertTotals("70.00", 1)
+
+        self.phone.delete()
+        self.assertTotals("0", 0)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_admin_inline_rows_refresh_totals(self):
+        self.client.force_login(User.objects.create_superuser(username="admin_test", password="qwerty"))
+        with translation.override("en"):
+            url = reverse("admin:shopapp_order_change", args=[self.order.pk])
+        response = self.client.post(url, {
+            "user": self.user.pk,
+            "promocode": "SALE",
+            "products": [self.phone.pk],
+            "receipt": SimpleUploadedFile("receipt.txt", b"receipt"),
+            "Order_products-TOTAL_FORMS": 1,
+            "Order_products-INITIAL_FORMS": 0,
+            "Order_products-0-order": self.order.pk,
+            "Order_products-0-product": self.laptop.pk,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertTotals("150.00", 2)
+
+    def test_save_without_price_change_skips_refresh(self):
+        self.order.products.add(self.laptop)
+        laptop = Product.objects.get(pk=self.laptop.pk)
+        laptop.name = "Notebook"
+        with CaptureQueriesContext(connection) as captured:
+            laptop.save()
+        self.assertFalse([q for q in captured if 'UPDATE "shopapp_order"' in q["sql"]])
+        laptop.price = "90.00"
+        laptop.save()
+        self.assertTotals("90.00", 1)
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_refresh_invalidates_user_export(self):
+        self.order.products.add(self.laptop)
+        cache.set(user_orders_export_key(self.user.pk), "stale")
+        with self.captureOnCommitCallbacks(execute=True):
+            refresh_order_totals(product_pks=[self.laptop.pk])
+        self.assertIsNone(cache.get(user_orders_export_key(self.user.pk)))
+
+    def test_reconcile_fixes_drift(self):
+        self.order.products.add(self.laptop)
+        Order.objects.filter(pk=self.order.pk).update(total=1, products_count=5)
+        out = StringIO()
+        call_command("reconcile_order_totals", batch_size=1, stdout=out)
+        self.assertIn("fixed 1", out.getvalue())
+        self.assertTotals("100.00", 1)
+
+
+class SalesRollupTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username="bob_test", password="qwerty", is_staff=True)
+        self.laptop = Product.objects.create(name="Laptop", price="100.00")
+        self.phone = Product.objects.create(name="Phone", price="50.00")
+
+    def create_order(self, created_at, *products):
+        order = Order.objects.create(user=self.user, promocode="SALE")
+        order.products.set(products)
+        Order.objects.filter(pk=order.pk).update(created_at=created_at)
+
+    def test_incremental_refresh_and_report(self):
+        day = datetime(2025, 3, 1, 12, tzinfo=dt_timezone.utc)
+        self.create_order(day, self.laptop, self.phone)
+        self.create_order(day, self.laptop)
+        refresh_sales_rollup(now=day.replace(hour=18))
+
+        self.create_order(day.replace(hour=20), self.laptop)
+        refresh_sales_rollup(now=day.replace(hour=23))
+
+        laptop_sales = DailyProductSales.objects.get(product=self.laptop)
+        self.assertEqual((laptop_sales.orders, laptop_sales.units), (3, 3))
+        self.assertEqual(laptop_sales.revenue, Decimal("300.00"))
+
+        self.client.force_login(self.user)
+        with translation.override("en"):
+            url = reverse("shopapp:sales-report")
+        response = self.client.get(url, {"start": "2025-03-01", "end": "2025-03-01", "top": 1})
+        data = response.json()
+        self.assertEqual(data["days"][0]["orders"], 3)
+        self.assertEqual(data["days"][0]["units"], 4)
+        self.assertEqual(data["top_products"][0]["product__name"], "Laptop")
+        self.assertEqual(len(data["top_products"]), 1)
+
+    def test_late_commit_and_edits_are_reflected(self):
+        day = datetime(2025, 3, 1, 12, tzinfo=dt_timezone.utc)
+        old_day = datetime(2025, 2, 1, 12, tzinfo=dt_timezone.utc)
+        self.create_order(old_day, self.laptop)
+        refresh_sales_rollup(now=day)
+
+        # заказ из долгой транзакции: created_at раньше отметки прошлого запуска
+        self.create_order(day - timedelta(hours=1), self.phone)
+        order = Order.objects.get(created_at=old_day)
+        order.products.add(self.phone)
+        order.save()
+        refresh_sales_rollup(now=day + timedelta(hours=1))
+
+        self.assertEqual(DailySales.objects.get(day=day.date()).orders, 1)
+        self.assertEqual(DailySales.objects.get(day=old_day.date()).units, 2)
+        self.assertEqual(
+            DailyProductSales.objects.get(day=old_day.date(), product=self.phone).revenue,
+            Decimal("50.00"),
+        )
+
+    def test_full_rebuild(self):
+        day = datetime(2025, 3, 1, 12, tzinfo=dt_timezone.utc)
+        self.create_order(day, self.phone)
+        refresh_sales_rollup(now=day.replace(hour=18))
+        refresh_sales_rollup(full=True, now=day.replace(hour=18))
+        self.assertEqual(DailyProductSales.objects.get(product=self.phone).orders, 1)
+        self.assertEqual(DailySales.objects.get(day=day.date()).orders, 1)
+
+    def test_negative_top_is_rejected(self):
+        self.client.force_login(self.user)
+        with translation.override("en"):
+            url = reverse("shopapp:sales-report")
+        self.assertEqual(self.client.get(url, {"top": -1}).status_code, 400)
+
+
+class GeneratedSitemapsTestCase(TestCase):
+    def setUp(self) -> None:
+        self.root = Path(tempfile.mkdtemp())
+        self.override = self.settings(SITEMAPS_ROOT=self.root, SITEMAPS_DOMAIN="shop.test")
+        self.override.enable()
+        self.product = Product.objects.create(name="Laptop")
+        Product.objects.create(name="Old", archived=True)
+
+    def tearDown(self) -> None:
+        self.override.disable()
+
+    def test_only_changed_pages_are_written(self):
+        self.assertEqual(generate_sitemaps()["written"], 2)
+        shop_page = (self.root / "sitemap-shop-1.xml").read_text()
+        self.assertIn(f"https://shop.test/en/shop/products/{self.product.pk}/", shop_page)
+        self.assertEqual(shop_page.count("<url>"), 1)
+
+        self.assertEqual(generate_sitemaps()["written"], 0)
+        self.product.save()
+        stats = generate_sitemaps()
+        self.assertEqual((stats["written"], stats["skipped"]), (1, 1))
+
+    def test_new_article_rewrites_only_last_page(self):
+        Article.objects.bulk_create(
+            Article(title=f"Article {i}", published_at=timezone.now()) for i in range(5)
+        )
+        with mock.patch.object(BlogSitemap, "limit", 2):
+            generate_sitemaps()
+            Article.objects.create(title="Newest", published_at=timezone.now())
+            stats = generate_sitemaps()
+        self.assertEqual((stats["written"], stats["skipped"]), (1, 3))
+        self.assertEqual(sorted(path.name for path in self.root.iterdir() if path.name.startswith(".")), [])
+
+    def test_sitemap_served_from_disk(self):
+        generate_sitemaps()
+        response = self.client.get("/sitemap.xml")
+        self.assertIn(b"https://shop.test/sitemap-shop-1.xml", b"".join(response.streaming_content))
+        response = self.client.get("/sitemap-shop-1.xml")
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+})
+class LatestProductsFeedTestCase(TestCase):
+    def setUp(self) -> None:
+        with translation.override("en"):
+            self.url = reverse("shopapp:products-feed")
+        self.product = Product.objects.create(name="Laptop", description="x" * 300)
+
+    def tearDown(self) -> None:
+        cache.clear()
+
+    def test_feed_is_cached_and_conditional(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, "x" * 200 + "<")
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name="Phone")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertContains(response, "Phone")
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), SHOP_THUMBNAIL_WIDTHS=(100, 200, 1000))
+class ProductThumbnailsTestCase(TestCase):
+    def make_image(self, name="photo.png"):
+        content = BytesIO()
+        Image.new("RGBA", (400, 300), (200, 10, 10, 255)).save(content, "PNG")
+        return SimpleUploadedFile(name, content.getvalue(), content_type="image/png")
+
+    @override_settings(SHOP_THUMBNAILS_EAGER=True)
+    def test_thumbnails_created_on_upload(self):
+        product = Product.objects.create(name="Laptop")
+        image = ProductImage.objects.create(product=product, image=self.make_image())
+        root = image.image.name.rsplit(".", 1)[0]
+        for suffix in ("__w100.webp", "__w100.jpg", "__w200.webp", "__w200.jpg"):
+            self.assertTrue(default_storage.exists(root + suffix))
+        self.assertFalse(default_storage.exists(root + "__w1000.webp"))
+
+        with translation.override("en"):
+            url = reverse("shopapp:product_details", kwargs={"pk": product.pk})
+        # srcset строится по записанным ширинам, без обращений к хранилищу
+        with mock.patch.object(type(default_storage._wrapped), "exists") as exists:
+            response = self.client.get(url)
+        exists.assert_not_called()
+        self.assertContains(response, 'type="image/webp"')
+        image_url = reverse("shopapp:product_image", kwargs={"pk": image.pk})
+        self.assertContains(response, f'src="{image_url}"')
+        self.assertContains(response, f"{image_url}?w=200&amp;fmt=webp 200w")
+        self.assertNotContains(response, settings.MEDIA_URL)
+        image.refresh_from_db()
+        self.assertEqual(image.image_thumbnails, {"name": image.image.name, "widths": [100, 200]})
+
+    @override_settings(SHOP_THUMBNAILS_EAGER=True)
+    def test_exif_orientation_applied(self):
+        content = BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # повёрнуто на 90 градусов
+        Image.new("RGB", (400, 300), (200, 10, 10)).save(content, "JPEG", exif=exif)
+        product = Product.objects.create(
+            name="Laptop",
+            preview=SimpleUploadedFile("photo.jpg", content.getvalue(), content_type="image/jpeg"),
+        )
+        root = product.preview.name.rsplit(".", 1)[0]
+        with default_storage.open(root + "__w100.jpg") as file, Image.open(file) as thumbnail:
+            self.assertEqual(thumbnail.size, (100, 133))
+
+    def test_upload_is_resized_in_process_pool(self):
+        executor = thumbnails.get_executor()
+
+        class WaitingExecutor:
+            # ждёт результат, чтобы запись ширин выполнилась в этом потоке
+            def submit(self, *args):
+                future = executor.submit(*args)
+                future.result(timeout=60)
+                return future
+
+        product = Product.objects.create(name="Laptop")
+        with (
+            mock.patch.object(thumbnails, "get_executor", return_value=WaitingExecutor()),
+            mock.patch.object(thumbnails, "close_old_connections"),
+        ):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                image = ProductImage.objects.create(product=product, image=self.make_image())
+                root = image.image.name.rsplit(".", 1)[0]
+                self.assertFalse(default_storage.exists(root + "__w100.webp"))
+        self.assertTrue(callbacks)
+        self.assertTrue(default_storage.exists(root + "__w100.webp"))
+        image.refresh_from_db()
+        self.assertEqual(image.image_thumbnails, {"name": image.image.name, "widths": [100, 200]})
+
+    def test_backfill_command(self):
+        product = Product.objects.create(name="Laptop")
+        image = ProductImage.objects.create(product=product, image=self.make_image("old.png"))
+        root = image.image.name.rsplit(".", 1)[0]
+        self.assertFalse(default_storage.exists(root + "__w100.webp"))
+        self.assertIsNone(image.image_thumbnails)
+
+        call_command("generate_thumbnails", stdout=StringIO())
+        self.assertTrue(default_storage.exists(root + "__w100.webp"))
+        image.refresh_from_db()
+        self.assertEqual(image.image_thumbnails["widths"], [100, 200])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class OrderReceiptDownloadTestCase(TestCase):
+    def setUp(self) -> None:
+        self.owner = User.objects.create_user(username="bob_test", password="qwerty")
+        self.other = User.objects.create_user(username="alice_test", password="qwerty")
+        self.order = Order.objects.create(user=self.owner, promocode="SALE")
+        self.order.receipt.save("receipt.txt", SimpleUploadedFile("receipt.txt", b"0123456789"))
+        with translation.override("en"):
+            self.url = reverse("shopapp:order_receipt", kwargs={"pk": self.order.pk})
+
+    def test_only_owner_can_download(self):
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url)
+        self.assertEqual(b"".join(response.streaming_content), b"0123456789")
+
+    def test_range_and_conditional_requests(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url, HTTP_RANGE="bytes=2-4")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 2-4/10")
+        self.assertEqual(b"".join(response.streaming_content), b"234")
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-3")
+        self.assertEqual(b"".join(response.streaming_content), b"789")
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE="bytes=20-").status_code, 416)
+
+        cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_non_ascii_filename_is_encoded(self):
+        self.order.receipt.save("чек.txt", SimpleUploadedFile("чек.txt", b"0123456789"))
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url)
+        self.assertEqual(
+            response["Content-Disposition"],
+            "attachment; filename*=utf-8''%D1%87%D0%B5%D0%BA.txt",
+        )
+
+    @override_settings(SHOP_SENDFILE_BACKEND="nginx")
+    def test_sendfile_offload(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/" + self.order.receipt.name)
+        self.assertEqual(response.content, b"")
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), SHOP_THUMBNAILS_EAGER=True, SHOP_THUMBNAIL_WIDTHS=(100,))
+class ProductImageDownloadTestCase(TestCase):
+    def setUp(self) -> None:
+        content = BytesIO()
+        Image.new("RGB", (400, 300), (200, 10, 10)).save(content, "PNG")
+        self.product = Product.objects.create(
+            name="Laptop",
+            preview=SimpleUploadedFile("preview.png", content.getvalue(), content_type="image/png"),
+        )
+        with translation.override("en"):
+            self.url = reverse("shopapp:product_preview", kwargs={"pk": self.product.pk})
+
+    def test_preview_and_thumbnails(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertEqual(b"".join(response.streaming_content)[:4], b"\x89PNG")
+
+        response = self.client.get(self.url, {"w": 100, "fmt": "webp"})
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertEqual(self.client.get(self.url, {"w": 200, "fmt": "webp"}).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {"w": 100, "fmt": "gif"}).status_code, 404)
+
+    def test_archived_preview_only_for_staff(self):
+        Product.objects.filter(pk=self.product.pk).update(archived=True)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.force_login(User.objects.create_user(username="staff_test", password="qwerty", is_staff=True))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class MetricsMiddlewareTestCase(TestCase):
+    def setUp(self) -> None:
+        registry.reset()
+        with translation.override("en"):
+            self.url = reverse("shopapp:product-list")
+            self.metrics_url = reverse("metrics")
+        self.product = Product.objects.create(name="Laptop", price=10)
+
+    def tearDown(self) -> None:
+        cache.clear()
+        registry.reset()
+
+    @override_settings(METRICS_ALLOWED_IPS=["127.0.0.1"])
+    def test_request_metrics_are_exposed(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        response = self.client.get(self.metrics_url)
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn(
+            'django_http_requests_total{route="shopapp:product-list",method="GET",status="200"} 2',
+            body,
+        )
+        self.assertIn('django_cache_requests_total{route="shopapp:product-list",result="hit"} 1', body)
+        self.assertIn('django_cache_requests_total{route="shopapp:product-list",result="miss"} 1', body)
+        self.assertIn('django_db_queries_per_request_count{route="shopapp:product-list"} 2', body)
+        self.assertNotIn('route="metrics"', body)
+
+    def test_metrics_endpoint_is_internal(self):
+        response = self.client.get(self.metrics_url, REMOTE_ADDR="203.0.113.5")
+        self.assertEqual(response.status_code, 403)
+        # локальный адрес (обратный прокси) без явного разрешения не пускается
+        self.assertEqual(self.client.get(self.metrics_url).status_code, 403)
+        self.client.force_login(User.objects.create_user(username="staff_test", password="qwerty", is_staff=True))
+        self.assertEqual(self.client.get(self.metrics_url).status_code, 200)
+
+    @override_settings(METRICS_ALLOWED_IPS=["127.0.0.1"])
+    def test_workers_are_aggregated(self):
+        directory = Path(tempfile.mkdtemp())
+        other_worker = MetricsRegistry()
+        other_worker.requests.inc(("shopapp:product-list", "GET", "200"), 3)
+        for pid in (1, 2):  # два других воркера
+            (directory / f"{pid}.json").write_text(json.dumps(other_worker.snapshot()))
+
+        self.client.get(self.url)
+        with self.settings(METRICS_MULTIPROCESS_DIR=directory):
+            body = self.client.get(self.metrics_url).content.decode()
+        self.assertIn(
+            'django_http_requests_total{route="shopapp:product-list",method="GET",status="200"} 7',
+            body,
+        )
+
+    def test_duplicate_queries_are_reported(self):
+        for i in range(5):
+            ProductImage.objects.create(product=self.product, description=f"image {i}")
+
+        def get_response(request):
+            for image in ProductImage.objects.all():
+                image.product.name
+            return HttpResponse("ok")
+
+        request = RequestFactory().get("/")
+        with self.assertLogs("mysite.metrics", level="WARNING") as logs:
+            MetricsMiddleware(get_response)(request)
+        self.assertIn("Possible N+1 on <unresolved>: 5 x", logs.output[0])
+        self.assertIn('django_db_duplicate_queries_total{route="<unresolved>"} 1', registry.render())
+
+
+@override_settings(PROFILING_ROOT=Path(tempfile.mkdtemp()))
+class ProfilerMiddlewareTestCase(TestCase):
+    def setUp(self) -> None:
+        self.staff = User.objects.create_user(username="admin_test", password="qwerty", is_staff=True)
+        self.user = User.objects.create_user(username="bob_test", password="qwerty")
+        with translation.override("en"):
+            self.url = reverse("shopapp:product-list")
+            self.list_url = reverse("profiles_list")
+
+    def test_staff_request_is_profiled(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url, {"profile": "cprofile"})
+        name = response["X-Profile-Name"]
+        self.assertTrue(name.endswith("-shopapp-product-list.prof"))
+        stats = pstats.Stats(str(settings.PROFILING_ROOT / name))
+        self.assertTrue(stats.total_calls > 0)
+
+        profiles = self.client.get(self.list_url).json()["profiles"]
+        self.assertEqual(profiles[0]["name"], name)
+        download = self.client.get(profiles[0]["url"])
+        self.assertEqual(download.status_code, 200)
+
+    def test_other_requests_are_not_profiled(self):
+        self.client.force_login(self.user)
+        self.assertNotIn("X-Profile-Name", self.client.get(self.url, {"profile": "1"}))
+        self.assertNotIn("X-Profile-Name", self.client.get(self.url, HTTP_X_PROFILE="forged"))
+        self.assertEqual(self.client.get(self.list_url).status_code, 302)
+
+    @override_settings(PROFILING_SAMPLE_INTERVAL=0.0001)
+    def test_signed_header_sampling(self):
+        original_list = ProductViewSet.list
+
+        def slow_list(viewset, request, *args, **kwargs):
+            # быстрый ответ мог завершиться раньше первого снимка стека
+            time.sleep(0.05)
+            return original_list(viewset, request, *args, **kwargs)
+
+        with mock.patch.object(ProductViewSet, "list", slow_list):
+            response = self.client.get(self.url, {"profile": "sample"}, HTTP_X_PROFILE=make_profile_token())
+        name = response["X-Profile-Name"]
+        self.assertTrue(name.endswith(".folded"))
+        lines = (settings.PROFILING_ROOT / name).read_text().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            self.assertTrue(int(count) > 0)
+
+
+class BenchmarkTestCase(TestCase):
+    def test_run_benchmark_on_seeded_data(self):
+        context = seed_dataset(products=20, orders=5, articles=3)
+        self.assertEqual(Product.objects.count(), 20)
+        self.assertEqual(Order.objects.count(), 5)
+
+        results = run_benchmark(
+            context,
+            iterations=3,
+            warmup=1,
+            names=["api_products_list", "api_order_detail"],
+        )
+        self.assertEqual(set(results), {"api_products_list", "api_order_detail"})
+        for result in results.values():
+            self.assertEqual(result["status"], 200)
+            self.assertTrue(result["queries"] > 0)
+            self.assertTrue(result["p95_ms"] >= result["p50_ms"])
+
+    def test_compare_with_baseline(self):
+        baseline = {
+            "fast": {"p95_ms": 1.0, "queries": 2},
+            "slow": {"p95_ms": 100.0, "queries": 2},
+        }
+        results = {
+            "fast": {"p95_ms": 1.5, "queries": 2},
+            "slow": {"p95_ms": 130.0, "queries": 3},
+        }
+        regressions = compare_with_baseline(results, baseline, threshold=0.2)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(all(line.startswith("slow:") for line in regressions))
+
+
+class GenerateShopDataTestCase(TestCase):
+    def generate(self):
+        return generate_shop_data(
+            users=3,
+            products=50,
+            orders=40,
+            distribution=ItemsDistribution("uniform", minimum=2, maximum=4),
+            seed=7,
+            batch_size=16,
+        )
+
+    def test_generated_orders_are_consistent(self):
+        stats = self.generate()
+        self.assertEqual(stats["users"][0], 3)
+        self.assertEqual(Product.objects.count(), 50)
+        self.assertEqual(Order.objects.count(), 40)
+        links = Order.products.through.objects.count()
+        self.assertEqual(stats["orders"][0], 40 + links)
+
+        expected = {
+            order.pk: (order.total, order.products_count)
+            for order in Order.objects.all()
+        }
+        self.assertTrue(all(2 <= count <= 4 for _, count in expected.values()))
+        refresh_order_totals(order_pks=expected)
+        self.assertEqual(
+            {order.pk: (order.total, order.products_count) for order in Order.objects.all()},
+            expected,
+        )
+
+    def test_generations_are_bumped(self):
+        before = {name: get_generation(name) for name in ("user", "order")}
+        self.generate()
+        for name, generation in before.items():
+            self.assertNotEqual(get_generation(name), generation)
+
+    def test_order_sizes_follow_distribution(self):
+        generate_shop_data(
+            users=2,
+            products=5,
+            orders=50,
+            distribution=ItemsDistribution("uniform", minimum=4, maximum=8),
+        )
+        counts = [
+            order.products.count()
+            for order in Order.objects.prefetch_related("products")
+        ]
+        # популярные товары выпадают повторно, но заказ не становится меньше minimum
+        self.assertTrue(all(4 <= count <= 5 for count in counts))
+        self.assertIn(5, counts)
+
+    def test_seed_is_reproducible(self):
+        self.generate()
+        first = list(Product.objects.order_by("pk").values_list("name", "price", "discount"))
+        Order.objects.all().delete()
+        Product.objects.all().delete()
+        self.generate()
+        second = list(Product.objects.order_by("pk").values_list("name", "price", "discount"))
+        self.assertEqual(first, second)
+
+
+@override_settings(DATABASE_REPLICAS=["replica1", "replica2"])
+class ReplicaRouterTestCase(TestCase):
+    databases = {"default", "replica1", "replica2"}
+
+    def setUp(self) -> None:
+        # поколения меняются только после фиксации, а TestCase её не делает
+        cache.clear()
+        self.product = Product.objects.create(name="Laptop", price=10)
+        with translation.override("en"):
+            self.list_url = reverse("shopapp:product-list")
+            self.detail_url = reverse("shopapp:product-detail", kwargs={"pk": self.product.pk})
+
+    def replicate(self):
+        for alias in settings.DATABASE_REPLICAS:
+            replicated = list(Product.objects.using(alias).values_list("pk", flat=True))
+            Product.objects.using(alias).bulk_create(
+                [Product(pk=product.pk, name=product.name, price=product.price)
+                 for product in Product.objects.exclude(pk__in=replicated)]
+            )
+
+    def test_reads_go_to_replicas(self):
+        self.assertEqual(self.client.get(self.detail_url).status_code, 404)
+        self.replicate()
+        with self.assertNumQueries(0, using="default"):
+            response = self.client.get(self.detail_url)
+        self.assertEqual(response.json()["name"], "Laptop")
+
+    def test_client_sticks_to_primary_after_write(self):
+        self.replicate()
+        response = self.client.post(self.list_url, {"name": "Tablet", "price": "20.00"})
+        self.assertEqual(response.status_code, 201)
+        cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie["max-age"], settings.REPLICA_PIN_SECONDS)
+
+        with translation.override("en"):
+            url = reverse("shopapp:product-detail", kwargs={"pk": response.json()["pk"]})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.cookies.pop(settings.REPLICA_PIN_COOKIE)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_streamed_export_reads_from_replicas(self):
+        user = User.objects.create_user(username="staff_test", password="qwerty", is_staff=True)
+        Order.objects.create(user=user, promocode="SALE")
+        self.client.force_login(user)
+        with translation.override("en"):
+            url = reverse("shopapp:orders-export")
+        for params in ({"format": "ndjson"}, {"stream": "1"}):
+            response = self.client.get(url, params)
+            with self.assertNumQueries(0, using="default"):
+                content = b"".join(response.streaming_content)
+            # заказ есть только в основной БД, реплики пусты
+            self.assertNotIn(b"SALE", content)
+            self.assertIsNone(_routing_state.get())
+
+    def test_cached_and_unmarked_reads_use_primary(self):
+        names = [product["name"] for product in self.client.get(self.list_url).json()["results"]]
+        self.assertEqual(names, ["Laptop"])
+        self.assertEqual(list(Product.objects.values_list("name", flat=True)), ["Laptop"])
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "shared": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "two-tier-tests",
+        "OPTIONS": {"MAX_ENTRIES": 50},
+    },
+    "invalidation": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "two-tier-log"},
+})
+class TwoTierCacheTestCase(TestCase):
+    def make_worker(self, **options):
+        return TwoTierCache(None, {"OPTIONS": {
+            "SHARED_CACHE": "shared",
+            "LOG_CACHE": "invalidation",
+            "SYNC_INTERVAL": 0,
+            **options,
+        }})
+
+    def tearDown(self) -> None:
+        caches["shared"].clear()
+        caches["invalidation"].clear()
+
+    def test_reads_fill_l1(self):
+        first, second = self.make_worker(), self.make_worker()
+        first.set("key", {"value": 1})
+        self.assertEqual(second.get("key"), {"value": 1})
+        self.assertEqual(second.get("key"), {"value": 1})
+        self.assertEqual(second.get("missing", "default"), "default")
+        self.assertEqual(second.stats(), {
+            "l1": {"hits": 1, "misses": 2, "entries": 1, "evictions": 0, "invalidations": 0},
+            "l2": {"hits": 1, "misses": 1},
+        })
+
+    def test_changes_are_broadcast_to_other_workers(self):
+        first, second = self.make_worker(), self.make_worker()
+        second.get("warm-up")
+        first.set("key", 1)
+        first.set("counter", 1)
+        self.assertEqual(second.get("key"), 1)
+        self.assertEqual(second.get("counter"), 1)
+
+        first.set("key", 2)
+        first.incr("counter")
+        self.assertEqual(second.get("key"), 2)
+        self.assertEqual(second.get("counter"), 2)
+
+        first.delete("key")
+        self.assertIsNone(second.get("key"))
+        self.assertEqual(second.stats()["l1"]["invalidations"], 3)
+
+    def test_invalidation_log_does_not_evict_data(self):
+        worker = self.make_worker()
+        worker.set(GENERATION_KEY.format(name="product"), 3, timeout=None)
+        for number in range(40):
+            worker.set(f"key-{number}", number)
+        other = self.make_worker()  # пустой L1, читает только из L2
+        self.assertEqual(other.get(GENERATION_KEY.format(name="product")), 3)
+        self.assertEqual(other.stats()["l2"]["hits"], 1)
+
+    def test_clear_is_broadcast(self):
+        first, second = self.make_worker(), self.make_worker()
+        second.get("warm-up")
+        first.set("key", 1)
+        self.assertEqual(second.get("key"), 1)
+        first.clear()
+        self.assertIsNone(second.get("key"))
+
+    def test_l1_is_bounded(self):
+        worker = self.make_worker(L1_MAX_ENTRIES=2, L1_TIMEOUT=0.05)
+        for key in ("a", "b", "c"):
+            worker.set(key, key)
+        self.assertEqual(worker.stats()["l1"]["entries"], 2)
+        self.assertEqual(worker.stats()["l1"]["evictions"], 1)
+        time.sleep(0.06)
+        self.assertEqual(worker.get("c"), "c")
+        self.assertEqual(worker.stats()["l2"]["hits"], 1)
+
+
+class LockedFileBasedCacheTestCase(TestCase):
+    def setUp(self) -> None:
+        self.location = tempfile.mkdtemp()
+        self.cache = LockedFileBasedCache(self.location, {})
+
+    def run_in_processes(self, target, count=4):
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=target) for _ in range(count)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+    def test_incr_is_atomic_across_processes(self):
+        self.cache.set("counter", 0, timeout=None)
+
+        def increment():
+            cache = LockedFileBasedCache(self.location, {})
+            for _ in range(50):
+                cache.incr("counter")
+
+        self.run_in_processes(increment)
+        self.assertEqual(self.cache.get("counter"), 200)
+
+    def test_add_is_exclusive_across_processes(self):
+        winners = multiprocessing.get_context("fork").Value("i", 0)
+
+        def add():
+            if LockedFileBasedCache(self.location, {}).add("lock", 1, timeout=60):
+                with winners.get_lock():
+                    winners.value += 1
+
+        self.run_in_processes(add, count=8)
+        self.assertEqual(winners.value, 1)
+
+    def test_incr_keeps_expiry(self):
+        self.cache.set("counter", 1, timeout=None)
+        self.cache.set("temporary", 1, timeout=0.05)
+        self.assertEqual(self.cache.incr("counter"), 2)
+        self.assertEqual(self.cache.incr("temporary"), 2)
+        time.sleep(0.06)
+        self.assertEqual(self.cache.get("counter"), 2)
+        self.assertIsNone(self.cache.get("temporary"))
+        with self.assertRaises(ValueError):
+            self.cache.incr("temporary")
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class GetOrComputeTestCase(TestCase):
+    def setUp(self) -> None:
+        registry.reset()
+        self.calls = 0
+
+    def tearDown(self) -> None:
+        cache.clear()
+        registry.reset()
+
+    def producer(self, delay=0.0):
+        def produce():
+            self.calls += 1
+            time.sleep(delay)
+            return self.calls
+        return produce
+
+    def events(self):
+        return {event: count for (name, event), count in registry.compute_events.values.items()}
+
+    def test_single_flight(self):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                get_or_compute("export", self.producer(delay=0.2), timeout=60, name="export"),
+            ))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [1] * 8)
+        self.assertEqual(self.events(), {"miss": 1, "waited": 7})
+
+    def test_stale_value_while_refreshing(self):
+        get_or_compute("export", self.producer(), timeout=60)
+        entry = cache.get("export")
+        entry["expires"] = time.time() - 1
+        cache.set("export", entry)
+        cache.add("export:lock", "other worker")
+
+        self.assertEqual(get_or_compute("export", self.producer(), timeout=60, name="export"), 1)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.events()["stale"], 1)
+
+    def test_early_refresh(self):
+        get_or_compute("export", self.producer(), timeout=60, name="export")
+        entry = cache.get("export")
+        entry["delta"] = 10 ** 9
+        cache.set("export", entry)
+        self.assertEqual(get_or_compute("export", self.producer(), timeout=60, name="export"), 2)
+        self.assertEqual(self.events(), {"miss": 1, "early_refresh": 1})
+        self.assertIsNone(cache.get("export:lock"))
+
+    def test_export_of_missing_user(self):
+        with translation.override("en"):
+            url = reverse("shopapp:export_user_orders", kwargs={"user_id": 404})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertIsNone(cache.get("orders_export_404:lock"))
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class OrderListFragmentCacheTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username="bob_test", password="qwerty")
+        self.other = User.objects.create_user(username="alice_test", password="qwerty")
+        self.product = Product.objects.create(name="Laptop", price=10)
+        self.order = Order.objects.create(user=self.user, promocode="SALE")
+        self.order.products.add(self.product)
+        self.client.force_login(self.user)
+        with translation.override("en"):
+            self.url = reverse("shopapp:user_orders", kwargs={"user_id": self.user.pk})
+            self.other_url = reverse("shopapp:user_orders", kwargs={"user_id": self.other.pk})
+            self.all_url = reverse("shopapp:orders_list")
+
+    def tearDown(self) -> None:
+        cache.clear()
+
+    def test_fragment_is_cached_until_data_changes(self):
+        self.assertContains(self.client.get(self.url), "Laptop for $10.00")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertFalse(any("shopapp_product" in query["sql"] for query in queries))
+
+        self.product.name = "Notebook"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertContains(self.client.get(self.url), "Notebook for $10.00")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(user=self.user, promocode="NEW")
+        self.assertContains(self.client.get(self.url), "NEW")
+
+    def test_fragments_are_not_shared(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(user=self.other, promocode="OTHER")
+        self.assertNotContains(self.client.get(self.url), "OTHER")
+        self.assertContains(self.client.get(self.other_url), "OTHER")
+
+        response = self.client.get(self.all_url)
+        self.assertContains(response, "<h1>Orders</h1>", html=True)
+        self.assertContains(response, "SALE")
+        self.assertContains(response, "OTHER")
@@ -0,0 +1,159 @@
+"""
+Уменьшенные копии изображений товаров для srcset.
+
+Для ``Product.preview`` и ``ProductImage.image`` рядом с оригиналом
+создаются копии нескольких ширин (``SHOP_THUMBNAIL_WIDTHS``) в WebP и JPEG:
+``<имя>__w320.webp``, ``<имя>__w320.jpg`` и т.д. Созданные ширины
+записываются в поле ``<поле>_thumbnails`` модели вместе с именем файла,
+поэтому srcset строится без обращений к хранилищу, а смена файла сразу
+видна как «копии ещё не готовы».
+
+Ресайз занимает процессор, поэтому после фиксации транзакции он
+отправляется в пул процессов (``SHOP_THUMBNAIL_WORKERS``), а ширины
+записываются, когда пул вернёт результат. Процессы пула запускаются
+через ``spawn``: ``fork`` из многопоточного веб-воркера небезопасен.
+Команда ``generate_thumbnails`` создаёт копии для уже загруженных файлов
+и для задач, потерянных при перезапуске. При ``SHOP_THUMBNAILS_EAGER = True``
+(в тестах) копии создаются сразу при сохранении.
+"""
+
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .media import product_image_url
+
+log = logging.getLogger(__name__)
+
+_executor = None
+
+FORMATS = {
+    "webp": ("WEBP", "webp"),
+    "jpeg": ("JPEG", "jpg"),
+}
+
+
+def get_widths():
+    return getattr(settings, "SHOP_THUMBNAIL_WIDTHS", (160, 320, 640))
+
+
+def derivative_name(name: str, width: int, fmt: str) -> str:
+    root, _ = os.path.splitext(name)
+    return f"{root}__w{width}.{FORMATS[fmt][1]}"
+
+
+def generate_derivatives(path: str, widths) -> list:
+    """
+    Создаёт уменьшенные копии файла ``path`` и возвращает их ширины.
+    Может выполняться в отдельном процессе, поэтому работает только
+    с путями и не трогает ORM.
+    """
+    written = []
+    with Image.open(path) as original:
+        # фото с телефона хранятся повёрнутыми, с ориентацией в EXIF
+        original = ImageOps.exif_transpose(original)
+        for width in sorted(widths):
+            if width >= original.width:
+                break
+            height = max(1, round(original.height * width / original.width))
+            resized = original.resize((width, height), Image.LANCZOS)
+            for fmt, (pil_format, _) in FORMATS.items():
+                image = resized
+                if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+                    image = image.convert("RGB")
+                image.save(derivative_name(path, width, fmt), pil_format, quality=82)
+            written.append(width)
+    return written
+
+
+def get_thumbnails(file):
+    """Запись о копиях для файла ``file`` или None, если их ещё нет."""
+    if not file:
+        return None
+    thumbnails = getattr(file.instance, f"{file.field.name}_thumbnails", None)
+    if not thumbnails or thumbnails.get("name") != file.name:
+        return None
+    return thumbnails
+
+
+def _thumbnails_update(model, field_name: str, thumbnails) -> dict:
+    values = {f"{field_name}_thumbnails": thumbnails}
+    # update() не трогает auto_now, а от updated_at зависит ETag товара
+    if any(field.name == "updated_at" for field in model._meta.concrete_fields):
+        values["updated_at"] = timezone.now()
+    return values
+
+
+def save_thumbnails(instance, field_name: str, widths) -> None:
+    thumbnails = {"name": getattr(instance, field_name).name, "widths": list(widths)}
+    setattr(instance, f"{field_name}_thumbnails", thumbnails)
+    type(instance)._default_manager.filter(pk=instance.pk).update(
+        **_thumbnails_update(type(instance), field_name, thumbnails)
+    )
+
+
+def make_thumbnails(instance, field_name: str) -> None:
+    file = getattr(instance, field_name)
+    widths = generate_derivatives(default_storage.path(file.name), tuple(get_widths()))
+    save_thumbnails(instance, field_name, widths)
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=getattr(settings, "SHOP_THUMBNAIL_WORKERS", 2),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def _record_thumbnails(model, pk, field_name: str, name: str, future) -> None:
+    try:
+        widths = future.result()
+    except Exception:
+        log.exception("Failed to generate thumbnails for %s", name)
+        return
+    close_old_connections()
+    try:
+        # файл могли заменить, пока шёл ресайз
+        model._default_manager.filter(pk=pk, **{field_name: name}).update(
+            **_thumbnails_update(model, field_name, {"name": name, "widths": widths})
+        )
+    finally:
+        close_old_connections()
+
+
+def _submit_thumbnails(model, pk, field_name: str, name: str) -> None:
+    future = get_executor().submit(generate_derivatives, default_storage.path(name), tuple(get_widths()))
+    future.add_done_callback(partial(_record_thumbnails, model, pk, field_name, name))
+
+
+def schedule_thumbnails(instance, field_name: str) -> None:
+    """Вызывается при сохранении модели с новым файлом."""
+    file = getattr(instance, field_name)
+    if not file or get_thumbnails(file) is not None:
+        return
+    if getattr(settings, "SHOP_THUMBNAILS_EAGER", False):
+        make_thumbnails(instance, field_name)
+        return
+    transaction.on_commit(partial(_submit_thumbnails, type(instance), instance.pk, field_name, file.name))
+
+
+def srcset(file, fmt: str) -> str:
+    """Строка для атрибута srcset из записанных копий."""
+    thumbnails = get_thumbnails(file)
+    if thumbnails is None:
+        return ""
+    return ", ".join(
+        f"{product_image_url(file, width, fmt)} {width}w"
+        for width in thumbnails["widths"]
+    )
@@ -6,8 +6,9 @@ from .views import (
     OrdersListView, ProductsListView, OrderDetailView,
     ProductDetailsView, ProductCreateView, ProductUpdateView,
     ProductDeleteView, OrderCreateView, OrderUpdateView, OrderDeleteView, ProductsDataExportView,
-    OrdersExportView, ProductViewSet, OrderViewSet,
+    OrdersExportView, ProductViewSet, OrderViewSet, ImportJobViewSet, SalesReportView,
     LatestProductsFeed, UserOrdersListView, export_user_orders,
+    OrderReceiptDownloadView, ProductImageDownloadView, ProductPreviewDownloadView,
 )
 
 app_name = "shopapp"
@@ -15,12 +16,14 @@ app_name = "shopapp"
 routers = DefaultRouter()
 routers.register("products", ProductViewSet)
 routers.register("orders", OrderViewSet)
+routers.register("import-jobs", ImportJobViewSet, basename="importjob")
 
 
 urlpatterns = [
     # path("", cache_page(60  * 3)(ShopIndexView.as_view()), name="index"),
     path("", ShopIndexView.as_view(), name="index"),
     path("api/", include(routers.urls)),
+    path("api/reports/sales/", SalesReportView.as_view(), name="sales-report"),
     path("groups/", GroupsListView.as_view(), name="groups_list"),
     path("products/", ProductsListView.as_view(), name="products_list"),
     path("products/export/", ProductsDataExportView.as_view(), name="products-export"),
@@ -34,6 +37,9 @@ urlpatterns = [
     path("orders/<int:pk>/", OrderDetailView.as_view(), name="order_details"),
     path("orders/<int:pk>/update/", OrderUpdateView.as_view(), name="order_update"),
     path("orders/<int:pk>/delete/", OrderDeleteView.as_view(), name="order_delete"),
+    path("orders/<int:pk>/receipt/", OrderReceiptDownloadView.as_view(), name="order_receipt"),
+    path("products/<int:pk>/preview/", ProductPreviewDownloadView.as_view(), name="product_preview"),
+    path("products/images/<int:pk>/", ProductImageDownloadView.as_view(), name="product_image"),
     path('products/latest/feed/', LatestProductsFeed(), name='products-feed'),
     path('users/<int:user_id>/orders/', UserOrdersListView.as_view(), name='user_orders'),
     path('users/<int:user_id>/orders/export/', export_user_orders, name='export_user_orders'),
@@ -4,41 +4,63 @@
 Разные view интернет-магазина: по товарам, заказам и т.д.
 """
 
+import gzip
 import logging
+from datetime import date, timedelta
 from timeit import default_timer
 from csv import DictWriter
 
 from django.contrib.auth.models import Group
-from django.http import HttpResponse, HttpRequest, HttpResponseRedirect, JsonResponse
+from django.http import Http404, HttpResponse, HttpRequest, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, reverse
 from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
 from django.urls import reverse_lazy
+from django.db.models.functions import Substr
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin, UserPassesTestMixin
 from django.views.decorators.cache import cache_page
-from rest_framework.viewsets import ModelViewSet
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.views import APIView
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .common import save_csv_products
+from .cache import get_or_compute, make_cache_key, make_generation_key, user_orders_export_key
+from .common import (
+    stream_csv_rows, stream_json_list, stream_ndjson,
+    iter_orders_export, build_user_orders_export,
+)
+from .conditional import products_list_condition, product_condition, order_condition
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from drf_spectacular.utils import extend_schema, OpenApiResponse
 
 from .forms import GroupForm, OrderForm
 from .forms import ProductForm, ProductImageFormSet
-from .models import Product, Order, ProductImage
-from .serializers import ProductSerializer, OrderSerializer
+from .jobs import enqueue_import
+from .models import Product, Order, ProductImage, ImportJob
+from .media import serve_protected_file
+from .pagination import ShopPagination
+from .reports import daily_sales, top_products
+from .search import ProductFullTextSearchFilter
+from .serializers import ProductSerializer, OrderSerializer, ImportJobSerializer
+from .thumbnails import FORMATS as THUMBNAIL_FORMATS, derivative_name, get_thumbnails
 
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
-from rest_framework import serializers
 
-from django.contrib.syndication.views import Feed
+from mysite.db_routers import use_primary, use_replica
+from mysite.feeds import CachedFeed
+from mysite.metrics import record_cache_lookup
 
 log = logging.getLogger(__name__)
 
@@ -46,12 +68,18 @@ User = get_user_model()
 
 
 class UserOrdersListView(LoginRequiredMixin, ListView):
-    template_name = 'shopapp/orders_list.html'
+    template_name = 'shopapp/order_list.html'
     context_object_name = 'orders'
 
     def get_queryset(self):
         self.owner = get_object_or_404(User, id=self.kwargs['user_id'])
-        return Order.objects.filter(user=self.owner).order_by('-pk')
+        return (
+            Order.objects
+            .filter(user=self.owner)
+            .select_related("user")
+            .prefetch_related("products")
+            .order_by('-pk')
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -59,20 +87,27 @@ class UserOrdersListView(LoginRequiredMixin, ListView):
         return context
 
 
-class LatestProductsFeed(Feed):
+class LatestProductsFeed(CachedFeed):
     title = "Shop products (latest)"
     description = "Updates on new products"
-    link = reverse_lazy("shopapp:products")
+    link = reverse_lazy("shopapp:products_list")
+    generations = ("product",)
 
     def items(self):
-        return Product.objects.order_by("-created_at")[:5]
+        return (
+            Product.objects
+            .annotate(short_description=Substr("description", 1, 200))
+            .only("pk", "name", "created_at")
+            .order_by("-created_at")[:5]
+        )
 
     def item_title(self, item: Product):
         return item.name
 
     def item_description(self, item: Product):
-        return item.description[:200]
+        return item.short_description
 
+@method_decorator(use_replica, name="dispatch")
 @extend_schema(description="Product views CRUD")
 class ProductViewSet(ModelViewSet):
     """
@@ -82,8 +117,9 @@ class ProductViewSet(ModelViewSet):
     """
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    pagination_class = ShopPagination
     filter_backends = [
-        SearchFilter,
+        ProductFullTextSearchFilter,
         DjangoFilterBackend,
         OrderingFilter,
     ]
@@ -101,10 +137,18 @@ class ProductViewSet(ModelViewSet):
         "discount",
     ]
 
-    @method_decorator(cache_page(60 * 2))
-    def list(self, *args, **kwargs):
-        print("hello products list")
-        return super().list(*args, **kwargs)
+    list_cache_timeout = 60 * 60 * 24
+
+    @products_list_condition
+    def list(self, request, *args, **kwargs):
+        cache_key = make_cache_key("products_list", request, "product")
+        data = cache.get(cache_key)
+        record_cache_lookup(data is not None)
+        if data is not None:
+            return Response(data)
+        response = use_primary(super().list)(request, *args, **kwargs)
+        cache.set(cache_key, response.data, self.list_cache_timeout)
+        return response
 
     @extend_schema(
         summary="Get one product by ID",
@@ -117,12 +161,11 @@ class ProductViewSet(ModelViewSet):
     def retrieve(self, *args, **kwargs):
         return super().retrieve(*args, **kwargs)
 
+    csv_export_chunk_size = 2000
+
     @action(methods=["get"], detail=False)
     def download_csv(self, request: Request):
-
-        response = HttpResponse(content_type="text/csv")
         filename = "products-export.csv"
-        response["Content-Disposition"] = f"attachment; filename={filename}"
         queryset = self.filter_queryset(self.get_queryset())
         fields = [
             "name",
@@ -130,6 +173,22 @@ class ProductViewSet(ModelViewSet):
             "price",
             "discount",
         ]
+
+        if request.query_params.get("stream") == "1":
+            # Потоковая выгрузка: строки читаются курсором по частям
+            # и пишутся в ответ по мере чтения, без загрузки моделей
+            rows = queryset.values_list(*fields).iterator(
+                chunk_size=self.csv_export_chunk_size,
+            )
+            response = StreamingHttpResponse(
+                stream_csv_rows(fields, rows),
+                content_type="text/csv",
+            )
+            response["Content-Disposition"] = f"attachment; filename={filename}"
+            return response
+
+        response = HttpResponse(content_type="text/csv")
+        response["Content-Disposition"] = f"attachment; filename={filename}"
         queryset = queryset.only(*fields)
         writer = DictWriter(response, fieldnames=fields)
         writer.writeheader()
@@ -148,47 +207,104 @@ class ProductViewSet(ModelViewSet):
         parser_classes=[MultiPartParser],
     )
     def upload_csv(self, request: Request):
-        products = save_csv_products(
-            request.FILES["file"].file,
+        job = enqueue_import(
+            ImportJob.KIND_PRODUCTS,
+            request.FILES["file"],
             encoding=request.encoding,
+            user=request.user,
+        )
+        return Response(
+            {
+                "job": job.pk,
+                "status_url": reverse("shopapp:importjob-detail", kwargs={"pk": job.pk}),
+            },
+            status=status.HTTP_202_ACCEPTED,
         )
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
 
+@method_decorator(use_replica, name="dispatch")
 class OrderViewSet(ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
+    pagination_class = ShopPagination
     filter_backends = [
         DjangoFilterBackend,
         OrderingFilter
     ]
-    filterset_fields = [
-        "user",
-        "delivery_address",
-        "promocode",
-    ]
+    filterset_fields = {
+        "user": ["exact"],
+        "delivery_address": ["exact"],
+        "promocode": ["exact"],
+        "total": ["exact", "gte", "lte"],
+        "products_count": ["exact", "gte", "lte"],
+    }
     ordering_fields = [
         "id",
         "user",
+        "total",
+        "products_count",
     ]
 
+
+class ImportJobViewSet(ReadOnlyModelViewSet):
+    """
+    Статус фоновых задач импорта: прогресс, число строк и ошибки.
+    """
+    serializer_class = ImportJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = ImportJob.objects.all()
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(user=self.request.user)
+        return queryset
+
+
+class SalesReportView(APIView):
+    """
+    Отчёт по продажам из дневных сводок: итоги по дням и топ товаров.
+
+    Параметры: ``start`` и ``end`` (YYYY-MM-DD, по умолчанию последние
+    30 дней) и ``top`` - число товаров в топе.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request: Request) -> Response:
+        today = timezone.now().date()
+        try:
+            end = date.fromisoformat(request.query_params.get("end", today.isoformat()))
+            start = date.fromisoformat(
+                request.query_params.get("start", (end - timedelta(days=30)).isoformat())
+            )
+            top = min(int(request.query_params.get("top", 10)), 100)
+        except ValueError:
+            raise ValidationError("start/end must be YYYY-MM-DD and top an integer")
+        if top < 1:
+            raise ValidationError("top must be a positive integer")
+
+        return Response({
+            "start": start,
+            "end": end,
+            "days": daily_sales(start, end),
+            "top_products": top_products(start, end, limit=top),
+        })
+
+
+@method_decorator(use_replica, name="dispatch")
 class OrdersExportView(UserPassesTestMixin, View):
     def test_func(self):
         return self.request.user.is_staff
 
     def get(self, request):
-        orders = Order.objects.select_related("user").prefetch_related("products")
-        orders_data = [
-            {
-                "id": order.pk,
-                "delivery_address": order.delivery_address,
-                "promocode": order.promocode,
-                "user_id": order.user.pk,
-                "product_ids": [product.pk for product in order.products.all()],
-            }
-            for order in orders
-        ]
-        return JsonResponse({"orders": orders_data})
+        orders = iter_orders_export()
+        if request.GET.get("format") == "ndjson":
+            return StreamingHttpResponse(
+                stream_ndjson(orders),
+                content_type="application/x-ndjson",
+            )
+        chunks = stream_json_list("orders", orders)
+        if request.GET.get("stream") == "1":
+            return StreamingHttpResponse(chunks, content_type="application/json")
+        return HttpResponse(b"".join(chunks), content_type="application/json")
 
 class ProductCreateView(CreateView):
     model = Product
@@ -279,6 +395,7 @@ class GroupsListView(View):
 
         return redirect(request.path)
 
+@method_decorator(use_replica, name="dispatch")
 class ProductDetailsView(DetailView):
     template_name = "shopapp/products-details.html"
     # model = Product
@@ -288,6 +405,11 @@ class ProductDetailsView(DetailView):
     def get_queryset(self):
         return Product.objects.filter(archived=False)
 
+    @product_condition
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+@method_decorator(use_replica, name="dispatch")
 class ProductsListView(ListView):
     template_name = "shopapp/products-list.html"
     context_object_name = "products"
@@ -309,11 +431,12 @@ class OrdersListView(LoginRequiredMixin, ListView):
         Order.objects
         .select_related("user")
         .prefetch_related("products")
-        .all()
+        .order_by("-pk")
     )
-    template_name = "shopapp/orders_list.html"
+    template_name = "shopapp/order_list.html"
     context_object_name = "orders"
 
+@method_decorator(use_replica, name="dispatch")
 class OrderDetailView(PermissionRequiredMixin, DetailView):
     permission_required = "shopapp.view_order"
     queryset = (
@@ -324,6 +447,76 @@ class OrderDetailView(PermissionRequiredMixin, DetailView):
     template_name = "shopapp/order_detail.html"
     context_object_name = "order"
 
+    @order_condition
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+class OrderReceiptDownloadView(LoginRequiredMixin, View):
+    """
+    Скачивание чека заказа: владельцу заказа, персоналу
+    и пользователям с правом shopapp.view_order.
+    """
+
+    def get(self, request: HttpRequest, pk: int) -> HttpResponse:
+        order = get_object_or_404(Order.objects.only("pk", "user_id", "receipt"), pk=pk)
+        user = request.user
+        if not (order.user_id == user.pk or user.is_staff or user.has_perm("shopapp.view_order")):
+            raise PermissionDenied
+        return serve_protected_file(request, order.receipt.name, as_attachment=True)
+
+
+def serve_product_image(request: HttpRequest, file, archived: bool) -> HttpResponse:
+    """
+    Изображения архивных товаров доступны только персоналу. С параметрами
+    ``w`` и ``fmt`` отдаётся уменьшенная копия, если она уже создана.
+    """
+    if archived and not request.user.is_staff:
+        raise Http404("Image not found")
+    name = file.name
+    width = request.GET.get("w")
+    if width is not None:
+        thumbnails = get_thumbnails(file)
+        fmt = request.GET.get("fmt", "jpeg")
+        if (
+            thumbnails is None
+            or fmt not in THUMBNAIL_FORMATS
+            or not width.isdigit()
+            or int(width) not in thumbnails["widths"]
+        ):
+            raise Http404("Image not found")
+        name = derivative_name(name, int(width), fmt)
+    return serve_protected_file(request, name)
+
+
+class ProductPreviewDownloadView(View):
+    """
+    Превью товара.
+    """
+
+    def get(self, request: HttpRequest, pk: int) -> HttpResponse:
+        product = get_object_or_404(
+            Product.objects.only("preview", "preview_thumbnails", "archived"),
+            pk=pk,
+        )
+        return serve_product_image(request, product.preview, product.archived)
+
+
+class ProductImageDownloadView(View):
+    """
+    Изображение товара.
+    """
+
+    def get(self, request: HttpRequest, pk: int) -> HttpResponse:
+        image = get_object_or_404(
+            ProductImage.objects
+            .select_related("product")
+            .only("image", "image_thumbnails", "product__archived"),
+            pk=pk,
+        )
+        return serve_product_image(request, image.image, image.product.archived)
+
+
 class OrderCreateView(CreateView):
     model = Order
     form_class = OrderForm
@@ -347,50 +540,62 @@ class OrderDeleteView(DeleteView):
     template_name = "shopapp/order_confirm_delete.html"
     success_url = reverse_lazy("shopapp:orders_list")
 
-class ProductsDataExportView(View):
-    def get(self, request: HttpResponse) -> JsonResponse:
-        cache_key = "products_data_export"
-        products_data = cache.get(cache_key)
-        if products_data is None:
-            products = Product.objects.order_by("pk").all()
-            products_data = [
-                {
-                    "pk": product.pk,
-                    "name": product.name,
-                    "price": product.price,
-                    "archived": product.archived
-                }
-                for product in products
-            ]
-            cache.set("products_data_export", products_data, 300)
-            elem = products_data[0]
-            name = elem["name"]
-            print("name:", name)
-        return JsonResponse({"products": products_data})
-
-
-class OrderSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Order
-        fields = '__all__'
+def accepts_gzip(request: HttpRequest) -> bool:
+    for coding in request.headers.get("Accept-Encoding", "").split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
 
 
-def export_user_orders(request, user_id):
-    cache_key = f'orders_export_{user_id}'
-    cached_data = cache.get(cache_key)
+@use_primary
+def build_products_export_payload() -> dict:
+    products = (
+        Product.objects
+        .order_by("pk")
+        .values("pk", "name", "price", "archived")
+    )
+    body = b"".join(stream_json_list("products", products))
+    return {
+        "body": body,
+        "gzip": gzip.compress(body, mtime=0),
+    }
 
-    if cached_data:
-        return JsonResponse(cached_data, safe=False)
 
-    owner = get_object_or_404(User, id=user_id)
-    orders = Order.objects.filter(user=owner).order_by('pk')
-    serializer = OrderSerializer(orders, many=True)
+def get_products_export_payload() -> dict:
+    """
+    Готовые к отправке байты выгрузки товаров (обычные и gzip).
+    Ключ включает поколение товаров, поэтому любое изменение товара
+    делает старую запись неактуальной.
+    """
+    return get_or_compute(
+        make_generation_key("products_data_export", "product"),
+        build_products_export_payload,
+        timeout=ProductsDataExportView.cache_timeout,
+        name="products_data_export",
+    )
 
-    data = {
-        'user_id': owner.id,
-        'username': owner.username,
-        'orders': serializer.data
-    }
 
-    cache.set(cache_key, data, timeout=300)
-    return JsonResponse(data)
\ No newline at end of file
+class ProductsDataExportView(View):
+    cache_timeout = 60 * 60 * 24
+
+    def get(self, request: HttpRequest) -> HttpResponse:
+        payload = get_products_export_payload()
+        if accepts_gzip(request):
+            response = HttpResponse(payload["gzip"], content_type="application/json")
+            response["Content-Encoding"] = "gzip"
+        else:
+            response = HttpResponse(payload["body"], content_type="application/json")
+        response["Content-Length"] = len(response.content)
+        patch_vary_headers(response, ["Accept-Encoding"])
+        return response
+
+
+def export_user_orders(request, user_id):
+    data = get_or_compute(
+        user_orders_export_key(user_id),
+        lambda: build_user_orders_export(get_object_or_404(User, id=user_id)),
+        timeout=300,
+        name="orders_export",
+    )
+    return JsonResponse(data)